@@ -0,0 +1,89 @@
+# benchmark for head alignment: HeadAligner against the expanding-window search that calc_offsets
+# used to run, on synthetic sentences with repeated heads and drifting FactBank offsets
+
+import argparse
+import random
+from time import perf_counter
+from head_aligner import HeadAligner
+
+WORDS = ['the', 'bank', 'said', 'it', 'will', 'report', 'that', 'rates', 'rise', 'and', 'fall', 'claims']
+
+
+# the pre-index implementation (count, then walk left and right one character at a time), kept as the baseline
+def expanding_window_search(raw_sentence, head, offset_start):
+    if raw_sentence.count(head) == 1:
+        return raw_sentence.index(head)
+
+    left_side_boundary = offset_start
+    right_side_boundary = left_side_boundary + 1
+    search_left = True
+    search_right = True
+    while True:
+        if left_side_boundary < 0:
+            search_left = False
+        if right_side_boundary > len(raw_sentence):
+            search_right = False
+        if not search_left and not search_right:
+            return None
+        if search_left and raw_sentence[left_side_boundary:left_side_boundary + len(head)] == head:
+            return left_side_boundary
+        if search_right and raw_sentence[right_side_boundary:right_side_boundary + len(head)] == head:
+            return right_side_boundary
+        left_side_boundary -= 1
+        right_side_boundary += 1
+
+
+def aligner_search(aligner, head, offset_start):
+    if aligner.count(head) == 1:
+        return aligner.find_all(head)[0]
+    return aligner.nearest(head, offset_start)
+
+
+# each sentence gets `heads` lookups, mostly of words that occur several times, with offsets
+# drifted by up to `drift` characters and a share of heads that never occur at all
+def build_corpus(num_sentences, sentence_words, heads, drift, seed):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(num_sentences):
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(sentence_words))
+        lookups = []
+        for _ in range(heads):
+            head = rng.choice(WORDS) if rng.random() > 0.1 else 'missing'
+            offset = rng.randrange(len(sentence)) + rng.randint(-drift, drift)
+            lookups.append((head, offset))
+        corpus.append((sentence, lookups))
+    return corpus
+
+
+def run(sizes, sentence_words, heads, drift, seed):
+    print('{:>10} {:>14} {:>12} {:>12} {:>9}'.format('sentences', 'words/sentence', 'window (s)',
+                                                      'aligner (s)', 'speedup'))
+    for num_sentences in sizes:
+        corpus = build_corpus(num_sentences, sentence_words, heads, drift, seed)
+
+        start = perf_counter()
+        window_results = [expanding_window_search(sentence, head, offset)
+                          for sentence, lookups in corpus for head, offset in lookups]
+        window_time = perf_counter() - start
+
+        start = perf_counter()
+        aligner_results = []
+        for sentence, lookups in corpus:
+            aligner = HeadAligner(sentence)
+            aligner_results.extend(aligner_search(aligner, head, offset) for head, offset in lookups)
+        aligner_time = perf_counter() - start
+
+        assert window_results == aligner_results, 'HeadAligner disagrees with the expanding-window search'
+        print('{:>10} {:>14} {:>12.4f} {:>12.4f} {:>8.1f}x'.format(num_sentences, sentence_words, window_time,
+                                                               aligner_time, window_time / aligner_time))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark head alignment on synthetic sentences.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[250, 500, 1000])
+    parser.add_argument('--words', type=int, default=60, help='words per sentence')
+    parser.add_argument('--heads', type=int, default=12, help='heads aligned per sentence')
+    parser.add_argument('--drift', type=int, default=20, help='largest offset error, in characters')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.sizes, args.words, args.heads, args.drift, args.seed)
@@ -0,0 +1,145 @@
+# benchmark for head spans: SpanResolver against the per-mention ancestor walk get_head_span used
+# to run, on the sentences and mentions of a finished fb_master.db; counts spaCy attribute accesses
+# (on Docs, Spans and Tokens) as well as time
+
+import argparse
+import sqlite3
+from itertools import groupby
+from time import perf_counter
+from spacy.tokens import Doc, Span, Token
+from fb_sentence_processor import load_model
+from span_resolver import SpanResolver
+
+
+# the pre-resolver implementation, kept as the baseline
+def ancestor_walk_span(doc, offset_start, offset_end):
+    fb_head_token = doc.char_span(offset_start, offset_end, alignment_mode='expand')[0]
+
+    if fb_head_token.dep_ == 'ROOT':
+        syntactic_head_token = fb_head_token
+    else:
+        syntactic_head_token = None
+        ancestors = list(fb_head_token.ancestors)
+        ancestors.insert(0, fb_head_token)
+
+        if len(ancestors) == 1:
+            syntactic_head_token = ancestors[0]
+        else:
+            for token in ancestors:
+                if token.pos_ in ['PRON', 'PROPN', 'NOUN', 'VERB', 'AUX']:
+                    syntactic_head_token = token
+                    break
+
+            if syntactic_head_token is None:
+                for token in ancestors:
+                    if token.pos_ == 'NUM':
+                        syntactic_head_token = token
+                        break
+
+    span_start = syntactic_head_token.left_edge.idx
+    span_end = syntactic_head_token.right_edge.idx + len(syntactic_head_token.right_edge.text)
+    return span_start, span_end
+
+
+def resolver_span(resolver, doc, offset_start, offset_end):
+    fb_head_token = doc.char_span(offset_start, offset_end, alignment_mode='expand')[0]
+    return resolver.span(fb_head_token.i)
+
+
+class AccessCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def wrap(self, value):
+        if isinstance(value, (Doc, Span, Token)):
+            return Counted(value, self)
+        # generators such as Token.ancestors hand out tokens one at a time
+        if hasattr(value, '__next__'):
+            return (self.wrap(item) for item in value)
+        # methods such as Doc.char_span hand back Spans
+        if callable(value):
+            return lambda *args, **kwargs: self.wrap(value(*args, **kwargs))
+        return value
+
+
+# a Doc, Span or Token that counts every attribute and item read through it
+class Counted:
+
+    __slots__ = ['_target', '_counter']
+
+    def __init__(self, target, counter):
+        self._target = target
+        self._counter = counter
+
+    def __getattr__(self, name):
+        self._counter.count += 1
+        return self._counter.wrap(getattr(self._target, name))
+
+    def __getitem__(self, key):
+        self._counter.count += 1
+        return self._counter.wrap(self._target[key])
+
+    def __len__(self):
+        return len(self._target)
+
+
+# {sentence_id: (sentence, [(token_offset_start, token_offset_end), ...])} for every aligned mention
+def load_mentions(master, limit):
+    con = sqlite3.connect(master)
+    rows = con.execute('SELECT s.sentence_id, s.sentence, m.token_offset_start, m.token_offset_end '
+                       'FROM sentences s JOIN mentions m ON m.sentence_id = s.sentence_id '
+                       'WHERE m.token_offset_start != -1 AND s.sentence_id <= ? '
+                       'ORDER BY s.sentence_id, m.token_id', (limit,)).fetchall()
+    con.close()
+    corpus = []
+    for _, group in groupby(rows, key=lambda row: row[0]):
+        group = list(group)
+        corpus.append((group[0][1], [(row[2], row[3]) for row in group]))
+    return corpus
+
+
+def run(master, limit):
+    corpus = load_mentions(master, limit)
+    docs = list(load_model().pipe(sentence for sentence, _ in corpus))
+    num_mentions = sum(len(offsets) for _, offsets in corpus)
+
+    start = perf_counter()
+    walk_results = [ancestor_walk_span(doc, *offset)
+                    for doc, (_, offsets) in zip(docs, corpus) for offset in offsets]
+    walk_time = perf_counter() - start
+
+    start = perf_counter()
+    resolver_results = []
+    for doc, (_, offsets) in zip(docs, corpus):
+        resolver = SpanResolver(doc)
+        resolver_results.extend(resolver_span(resolver, doc, *offset) for offset in offsets)
+    resolver_time = perf_counter() - start
+
+    assert walk_results == resolver_results, 'SpanResolver disagrees with the ancestor walk'
+
+    walk_counter = AccessCounter()
+    for doc, (_, offsets) in zip(docs, corpus):
+        counted = walk_counter.wrap(doc)
+        for offset in offsets:
+            ancestor_walk_span(counted, *offset)
+
+    resolver_counter = AccessCounter()
+    for doc, (_, offsets) in zip(docs, corpus):
+        counted = resolver_counter.wrap(doc)
+        resolver = SpanResolver(counted)
+        for offset in offsets:
+            resolver_span(resolver, counted, *offset)
+
+    print('{} sentences, {} mentions'.format(len(corpus), num_mentions))
+    print('{:>16} {:>12} {:>22}'.format('', 'time (s)', 'accesses per sentence'))
+    print('{:>16} {:>12.4f} {:>22.1f}'.format('ancestor walk', walk_time, walk_counter.count / len(corpus)))
+    print('{:>16} {:>12.4f} {:>22.1f}'.format('SpanResolver', resolver_time, resolver_counter.count / len(corpus)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark head-span computation on a converted FactBank.')
+    parser.add_argument('--master', default='fb_master.db', help='a database written by fb2master.py')
+    parser.add_argument('--limit', type=int, default=1000, help='number of sentences to use')
+    args = parser.parse_args()
+    run(args.master, args.limit)
@@ -0,0 +1,82 @@
+# micro-benchmark for FbSentenceProcessor.find_parent_source on a synthetic corpus of nested sources;
+# compares the indexed lookup against the linear scan it replaced
+
+import argparse
+import spacy
+from time import perf_counter
+from fb_sentence_processor import FbSentenceProcessor
+
+
+# the pre-index implementation, kept here as the baseline; Source records no longer carry the relevant
+# source ID it compared, so it scans a list of them kept alongside sp.sources (see build_sources)
+def linear_find_parent_source(sp, relevant_source_ids, global_sentence_id, nesting_level, current_nesting_level,
+                              rel_source_id):
+    if nesting_level == 0:
+        return -1
+    parent_relevant_source_id = sp.calc_parent_source(rel_source_id)
+    for i in range(len(sp.sources)):
+        if sp.sources[i][1] == global_sentence_id \
+                and sp.sources[i][4] == current_nesting_level - 1 \
+                and relevant_source_ids[i] == parent_relevant_source_id:
+            return i + 1
+    return None
+
+
+# every sentence gets AUTHOR plus `fanout` sources per nesting level, each nested under
+# a source on the level above, e.g. s0 -> s1_s0 -> s4_s1_s0 -> ...; returns the lookups along with
+# each source's relevant source ID, in sp.sources order
+def build_sources(sp, num_sentences, depth, fanout):
+    lookups = []
+    relevant_source_ids = []
+    for global_sentence_id in range(1, num_sentences + 1):
+        sp.add_source(global_sentence_id, 0, -1, 0, 'AUTHOR', 's0')
+        relevant_source_ids.append('s0')
+        previous_level = ['s0']
+        next_local_id = 1
+        for nesting_level in range(1, depth + 1):
+            current_level = []
+            for i in range(fanout):
+                parent = previous_level[i % len(previous_level)]
+                rel_source_id = 's{}_{}'.format(next_local_id, parent)
+                next_local_id += 1
+                relevant_source_id = rel_source_id[:rel_source_id.index('_')]
+                parent_source_id = sp.find_parent_source(global_sentence_id, nesting_level,
+                                                         nesting_level, rel_source_id)
+                sp.add_source(global_sentence_id, 0, parent_source_id, nesting_level,
+                              'source', relevant_source_id)
+                relevant_source_ids.append(relevant_source_id)
+                lookups.append((global_sentence_id, nesting_level, nesting_level, rel_source_id))
+                current_level.append(relevant_source_id)
+            previous_level = current_level
+    return lookups, relevant_source_ids
+
+
+def time_lookups(find, sp, lookups):
+    start = perf_counter()
+    results = [find(sp, *lookup) for lookup in lookups]
+    return perf_counter() - start, results
+
+
+def run(sizes, depth, fanout):
+    nlp = spacy.blank('en')
+    print('{:>10} {:>10} {:>12} {:>12} {:>9}'.format('sentences', 'sources', 'linear (s)', 'indexed (s)', 'speedup'))
+    for num_sentences in sizes:
+        sp = FbSentenceProcessor([], {}, {}, {}, {}, nlp=nlp)
+        lookups, relevant_source_ids = build_sources(sp, num_sentences, depth, fanout)
+
+        linear_time, linear_results = time_lookups(
+            lambda sp, *lookup: linear_find_parent_source(sp, relevant_source_ids, *lookup), sp, lookups)
+        indexed_time, indexed_results = time_lookups(FbSentenceProcessor.find_parent_source, sp, lookups)
+        assert linear_results == indexed_results, 'indexed lookup disagrees with the linear scan'
+
+        print('{:>10} {:>10} {:>12.4f} {:>12.4f} {:>8.1f}x'.format(num_sentences, len(sp.sources), linear_time,
+                                                               indexed_time, linear_time / indexed_time))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark parent-source lookups on nested sources.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 200, 400, 800])
+    parser.add_argument('--depth', type=int, default=3, help='deepest nesting level per sentence')
+    parser.add_argument('--fanout', type=int, default=3, help='sources per nesting level per sentence')
+    args = parser.parse_args()
+    run(args.sizes, args.depth, args.fanout)
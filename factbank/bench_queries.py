@@ -0,0 +1,83 @@
+# times every query in queries.sql against a built master database, first without the supporting
+# indexes and planner statistics (as the schema used to be) and then with them
+
+import argparse
+import sqlite3
+from time import perf_counter
+from ddl import DDL
+
+
+# splitting queries.sql into (name, sql) pairs, naming each query after the comment above it
+def read_queries(path):
+    queries = []
+    for statement in open(path).read().split(';'):
+        lines = [line.strip() for line in statement.strip().splitlines()]
+        comments = [line.lstrip('-').strip() for line in lines if line.startswith('--')]
+        sql = '\n'.join(line for line in lines if line and not line.startswith('--'))
+        if sql:
+            queries.append((comments[0] if comments else 'query {}'.format(len(queries) + 1), sql))
+    return queries
+
+
+# an in-memory copy of the database, so both variants start from identical data and a warm cache
+def copy_database(path):
+    source = sqlite3.connect(path)
+    con = sqlite3.connect(':memory:')
+    source.backup(con)
+    source.close()
+    return con
+
+
+def drop_indexes(con):
+    names = [row[0] for row in con.execute("SELECT name FROM sqlite_master "
+                                           "WHERE type = 'index' AND sql IS NOT NULL")]
+    for name in names:
+        con.execute('DROP INDEX {}'.format(name))
+    if con.execute("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        con.execute('DELETE FROM sqlite_stat1')
+    con.execute('ANALYZE sqlite_master')
+
+
+def build_indexes(con):
+    for index in DDL.INDEXES:
+        con.execute(index)
+    con.execute('ANALYZE')
+
+
+def time_query(con, sql, params, repeat):
+    best = None
+    rows = 0
+    for _ in range(repeat):
+        start = perf_counter()
+        rows = len(con.execute(sql, params).fetchall())
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, rows
+
+
+def run(database, queries_path, repeat, source_id):
+    queries = read_queries(queries_path)
+    params = {'source_id': source_id}
+
+    before = copy_database(database)
+    drop_indexes(before)
+    after = copy_database(database)
+    build_indexes(after)
+
+    print('{:<30} {:>8} {:>12} {:>12} {:>9}'.format('query', 'rows', 'before (s)', 'after (s)', 'speedup'))
+    for name, sql in queries:
+        sql_params = params if ':source_id' in sql else {}
+        before_time, rows = time_query(before, sql, sql_params, repeat)
+        after_time, _ = time_query(after, sql, sql_params, repeat)
+        print('{:<30} {:>8} {:>12.4f} {:>12.4f} {:>8.1f}x'.format(name[:30], rows, before_time, after_time,
+                                                               before_time / max(after_time, 1e-9)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time the queries in queries.sql with and without indexes.')
+    parser.add_argument('--database', default='fb_master.db')
+    parser.add_argument('--queries', default='queries.sql')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per query; the best time is kept')
+    parser.add_argument('--source-id', type=int, default=1, help='value bound to :source_id')
+    args = parser.parse_args()
+    run(args.database, args.queries, args.repeat, args.source_id)
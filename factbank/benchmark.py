@@ -0,0 +1,109 @@
+# benchmark harness: generates a synthetic FactBank at a chosen scale, runs FB2Master over it and
+# writes a machine-readable report of per-stage timings, throughput and peak memory
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sqlite3
+from time import perf_counter
+from fb2master import FB2Master
+from synthetic_factbank import SyntheticFactBank
+
+
+# peak resident set size of this process and of any (finished) worker processes, in MB
+def peak_memory_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if platform.system() == 'Darwin' else 1024
+    return {'self': round(own / scale, 1), 'workers': round(children / scale, 1)}
+
+
+# asking the OS to drop a file's pages from its cache, so that the next read of it is cold; only a
+# hint, and only where posix_fadvise exists
+def evict_from_page_cache(path):
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return True
+
+
+def count_rows(path):
+    con = sqlite3.connect(path)
+    counts = {table: con.execute('SELECT COUNT(*) FROM {}'.format(table)).fetchone()[0]
+              for table in ['sentences', 'mentions', 'sources', 'attitudes', 'errors']}
+    con.close()
+    return counts
+
+
+def run(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    report_path = os.path.abspath(args.report)
+    os.chdir(args.workdir)
+
+    corpus = {'files': args.files, 'sentences': args.sentences, 'depth': args.depth,
+              'ambiguity': args.ambiguity, 'drift': args.drift, 'missing': args.missing, 'seed': args.seed}
+    if not args.keep_corpus or not os.path.exists('factbank_data.db'):
+        SyntheticFactBank('factbank_data.db', **corpus).generate()
+
+    converter_options = {'batch_size': args.batch_size, 'workers': args.workers, 'parse_cache': args.parse_cache,
+                         'staged': args.staged, 'flush_size': args.stream, 'bulk_load': args.bulk_load,
+                         'source_mode': args.source_mode}
+    cold = args.cold and evict_from_page_cache('factbank_data.db')
+    start = perf_counter()
+    converter = FB2Master(**converter_options)
+    converter.generate_database()
+    total = perf_counter() - start
+
+    counts = count_rows('fb_master.db')
+    report = {
+        'corpus': corpus,
+        'options': converter_options,
+        'cold_source': cold,
+        'source_open_seconds': round(converter.metrics.seconds('source.open'), 4),
+        'stages': {stage: round(seconds, 4) for stage, seconds in converter.stage_timings().items()},
+        'total_seconds': round(total, 4),
+        'rows': counts,
+        'throughput': {'sentences_per_second': round(counts['sentences'] / total, 1),
+                       'attitudes_per_second': round(counts['attitudes'] / total, 1)},
+        'peak_memory_mb': peak_memory_mb(),
+        'metrics': converter.metrics.snapshot(),
+    }
+
+    with open(report_path, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark fb2master.py on a synthetic FactBank.')
+    parser.add_argument('--workdir', default='bench_run', help='where the synthetic and master databases go')
+    parser.add_argument('--report', default='bench_report.json')
+    parser.add_argument('--keep-corpus', action='store_true', help='reuse a synthetic database left in workdir')
+
+    corpus_group = parser.add_argument_group('synthetic corpus')
+    corpus_group.add_argument('--files', type=int, default=50)
+    corpus_group.add_argument('--sentences', type=int, default=20, help='sentences per file')
+    corpus_group.add_argument('--depth', type=int, default=2, help='deepest source nesting level')
+    corpus_group.add_argument('--ambiguity', type=float, default=0.3, help='chance a head occurs twice')
+    corpus_group.add_argument('--drift', type=float, default=0.1, help='chance a sentence\'s offsets are shifted')
+    corpus_group.add_argument('--missing', type=float, default=0.05, help='chance a target head is absent')
+    corpus_group.add_argument('--seed', type=int, default=0)
+
+    converter_group = parser.add_argument_group('converter (as in fb2master.py)')
+    converter_group.add_argument('--workers', type=int, default=1)
+    converter_group.add_argument('--batch-size', type=int, default=256)
+    converter_group.add_argument('--parse-cache', nargs='?', const='fb_parse_cache.db', default=None)
+    converter_group.add_argument('--staged', action='store_true')
+    converter_group.add_argument('--stream', type=int, nargs='?', const=1000, default=0)
+    converter_group.add_argument('--bulk-load', action='store_true')
+    converter_group.add_argument('--source-mode', choices=FB2Master.SOURCE_MODES, default='mmap')
+    converter_group.add_argument('--cold', action='store_true',
+                                 help='evict factbank_data.db from the OS page cache before converting')
+    run(parser.parse_args())
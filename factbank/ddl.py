@@ -8,20 +8,57 @@ from os import remove
 
 
 class DDL:
-    def __init__(self, name):
-        self.check_if_exists(name)
-        self.con = sqlite3.connect(name + '_master.db')
+    # pragmas for a bulk load: the database is normally rebuilt from scratch, so durability
+    # can wait until the load is over (see end_bulk_load); an interrupted incremental build
+    # may need a full rebuild afterwards. Foreign keys are never enforced while writing (the
+    # foreign_keys pragma stays off), with or without a bulk load; end_bulk_load checks them once
+    BULK_LOAD_PRAGMAS = ['PRAGMA journal_mode = MEMORY',
+                         'PRAGMA synchronous = OFF',
+                         'PRAGMA cache_size = -262144',  # 256 MB
+                         'PRAGMA temp_store = MEMORY']
+
+    # supporting indexes for the joins in queries.sql
+    INDEXES = ['CREATE INDEX IF NOT EXISTS sentences_file ON sentences (file, file_sentence_id)',
+               # an interval index: a sentence's mentions in offset order, with their ends alongside
+               # for overlap tests (see fb_search.FbSearch.overlapping_mentions)
+               'CREATE INDEX IF NOT EXISTS mentions_sentence_offsets '
+               'ON mentions (sentence_id, token_offset_start, token_offset_end)',
+               'CREATE INDEX IF NOT EXISTS sources_sentence ON sources (sentence_id)',
+               'CREATE INDEX IF NOT EXISTS sources_token ON sources (token_id)',
+               'CREATE INDEX IF NOT EXISTS sources_parent ON sources (parent_source_id)',
+               'CREATE INDEX IF NOT EXISTS attitudes_source_target ON attitudes (source_id, target_token_id)',
+               'CREATE INDEX IF NOT EXISTS attitudes_target ON attitudes (target_token_id)',
+               'CREATE INDEX IF NOT EXISTS source_ancestors_ancestor ON source_ancestors (ancestor_source_id, depth)',
+               # the filters fb_views.AttitudeViews offers over the precomputed attitude tables
+               'CREATE INDEX IF NOT EXISTS attitude_basic_file ON attitude_basic (file, file_sentence_id)',
+               'CREATE INDEX IF NOT EXISTS attitude_basic_label ON attitude_basic (label, nesting_level)',
+               'CREATE INDEX IF NOT EXISTS attitude_basic_nesting ON attitude_basic (nesting_level)',
+               'CREATE INDEX IF NOT EXISTS attitude_basic_source ON attitude_basic (source_id)',
+               'CREATE INDEX IF NOT EXISTS attitude_basic_source_text ON attitude_basic (source_text)',
+               'CREATE INDEX IF NOT EXISTS attitude_span_file ON attitude_span (file, file_sentence_id)',
+               'CREATE INDEX IF NOT EXISTS attitude_span_label ON attitude_span (label, nesting_level)',
+               'CREATE INDEX IF NOT EXISTS attitude_span_nesting ON attitude_span (nesting_level)',
+               'CREATE INDEX IF NOT EXISTS attitude_span_source ON attitude_span (source_id)',
+               'CREATE INDEX IF NOT EXISTS attitude_span_source_text ON attitude_span (source_text)']
+
+    # overwrite=False keeps an existing database, for incremental rebuilds; shared=True lets the
+    # connection be handed to another thread (the pipelined writer, see fb_pipeline.py); URIs are
+    # enabled so that databases can be attached read-only (see fb_staging.py)
+    def __init__(self, name, overwrite=True, shared=False):
+        if overwrite:
+            self.check_if_exists(name)
+        self.con = sqlite3.connect(name + '_master.db', check_same_thread=not shared, uri=True)
         self.cur = self.con.cursor()
 
-    # DDL for tables
+    # DDL for tables; existing tables are kept, for incremental rebuilds
     def create_tables(self):
-        self.cur.execute('CREATE TABLE sentences ('
+        self.cur.execute('CREATE TABLE IF NOT EXISTS sentences ('
                          'sentence_id INTEGER PRIMARY KEY,'
                          'file VARCHAR2(255),'
                          'file_sentence_id INTEGER,'
                          'sentence VARCHAR2(255) )')
 
-        self.cur.execute('CREATE TABLE mentions ('
+        self.cur.execute('CREATE TABLE IF NOT EXISTS mentions ('
                          'token_id INTEGER PRIMARY KEY,'
                          'sentence_id REFERENCES sentences(sentence_id),'
                          'token_text VARCHAR2(255),'
@@ -31,7 +68,7 @@ class DDL:
                          'phrase_offset_start INTEGER,'
                          'phrase_offset_end INTEGER )')
 
-        self.cur.execute('CREATE TABLE sources ('
+        self.cur.execute('CREATE TABLE IF NOT EXISTS sources ('
                          'source_id INTEGER PRIMARY KEY,'
                          'sentence_id REFERENCES sentences(sentence_id),'
                          'token_id REFERENCES mentions(token_id),'
@@ -39,14 +76,160 @@ class DDL:
                          'nesting_level INTEGER,'
                          '[source] VARCHAR2(255) )')
 
-        self.cur.execute('CREATE TABLE attitudes ('
+        self.cur.execute('CREATE TABLE IF NOT EXISTS attitudes ('
                          'attitude_id INTEGER PRIMARY KEY,'
                          'source_id REFERENCES sources(source_id),'
                          'target_token_id REFERENCES mentions(token_id),'
                          'label VARCHAR2(255),'
                          'label_type VARCHAR2(255) )')
 
+        # closure table over sources.parent_source_id: one row per source and ancestor,
+        # including the source itself at depth 0
+        self.cur.execute('CREATE TABLE IF NOT EXISTS source_ancestors ('
+                         'source_id REFERENCES sources(source_id),'
+                         'ancestor_source_id REFERENCES sources(source_id),'
+                         'depth INTEGER,'
+                         'PRIMARY KEY (source_id, ancestor_source_id) )')
+
+        # result_sentence, the raw sentence with the expected head starred in at FactBank's offsets, is
+        # only computed when read; the slicing follows Python's, negative offsets included
+        self.cur.execute('CREATE TABLE IF NOT EXISTS errors ('
+                         'error_id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                         'file VARCHAR2(255),'
+                         'file_sentence_id INTEGER,'
+                         'offset_start INTEGER,'
+                         'offset_end INTEGER,'
+                         'predicted_head VARCHAR2(255),'
+                         'head VARCHAR2(255),'
+                         'raw_sentence VARCHAR2(255),'
+                         'result_sentence VARCHAR2(255) GENERATED ALWAYS AS ('
+                         'SUBSTR(raw_sentence, 1, CASE WHEN offset_start < 0 '
+                         'THEN MAX(LENGTH(raw_sentence) + offset_start, 0) ELSE offset_start END) '
+                         "|| '* ' || head || ' *' || "
+                         'SUBSTR(raw_sentence, 1 + CASE WHEN offset_end < 0 '
+                         'THEN MAX(LENGTH(raw_sentence) + offset_end, 0) ELSE offset_end END)) VIRTUAL,'
+                         'rel_source_text VARCHAR2(255) )')
+
+        # the BASIC and SPAN queries in queries.sql, one row per attitude, kept up to date by
+        # fb_views.refresh_views at the end of every build; attitude_basic also carries the source's
+        # ID and nesting level so that it can be filtered on them
+        self.cur.execute('CREATE TABLE IF NOT EXISTS attitude_basic ('
+                         'attitude_id INTEGER PRIMARY KEY,'
+                         'sentence_id INTEGER,'
+                         'sentence VARCHAR2(255),'
+                         'file VARCHAR2(255),'
+                         'file_sentence_id INTEGER,'
+                         'target_head VARCHAR2(255),'
+                         'target_offset_start INTEGER,'
+                         'target_offset_end INTEGER,'
+                         'target_token INTEGER,'
+                         'label VARCHAR2(255),'
+                         'source_text VARCHAR2(255),'
+                         'source_offset_start INTEGER,'
+                         'source_offset_end INTEGER,'
+                         'source_token_id INTEGER,'
+                         'source_id INTEGER,'
+                         'nesting_level INTEGER )')
+
+        self.cur.execute('CREATE TABLE IF NOT EXISTS attitude_span ('
+                         'attitude_id INTEGER PRIMARY KEY,'
+                         'sentence_id INTEGER,'
+                         'sentence VARCHAR2(255),'
+                         'file VARCHAR2(255),'
+                         'file_sentence_id INTEGER,'
+                         'target_head VARCHAR2(255),'
+                         'target_offset_start INTEGER,'
+                         'target_offset_end INTEGER,'
+                         'target_span_start INTEGER,'
+                         'target_span_end INTEGER,'
+                         'target_span VARCHAR2(255),'
+                         'target_token INTEGER,'
+                         'label VARCHAR2(255),'
+                         'source_text VARCHAR2(255),'
+                         'nesting_level INTEGER,'
+                         'source_offset_start INTEGER,'
+                         'source_offset_end INTEGER,'
+                         'source_span_start INTEGER,'
+                         'source_span_end INTEGER,'
+                         'source_span VARCHAR2(255),'
+                         'source_token_id INTEGER,'
+                         'parent_source_id INTEGER,'
+                         'source_id INTEGER )')
+
+        # full-text indexes over sentence text and mention heads and phrases, reading their text
+        # from the tables themselves (FTS5 external content); filled in by rebuild_search
+        self.cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS sentence_search USING fts5("
+                         "sentence, content='sentences', content_rowid='sentence_id')")
+
+        self.cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS mention_search USING fts5("
+                         "token_text, phrase_text, content='mentions', content_rowid='token_id')")
+
+        # build bookkeeping for incremental rebuilds: a fingerprint per raw FactBank file, and the
+        # next free ID per table, so IDs are never reused once their rows are replaced
+        self.cur.execute('CREATE TABLE IF NOT EXISTS file_fingerprints ('
+                         'file VARCHAR2(255) PRIMARY KEY,'
+                         'fingerprint CHAR(40) )')
+
+        self.cur.execute('CREATE TABLE IF NOT EXISTS id_counters ('
+                         'table_name VARCHAR2(255) PRIMARY KEY,'
+                         'next_id INTEGER )')
+
+        # where an unfinished build got to: the last sentence committed, the next ID per table and
+        # the first attitude of the build; at most one row, removed once the build completes
+        self.cur.execute('CREATE TABLE IF NOT EXISTS checkpoint ('
+                         'checkpoint_id INTEGER PRIMARY KEY CHECK (checkpoint_id = 1),'
+                         'file VARCHAR2(255),'
+                         'file_sentence_id INTEGER,'
+                         'next_sentence_id INTEGER,'
+                         'next_mention_id INTEGER,'
+                         'next_source_id INTEGER,'
+                         'next_attitude_id INTEGER,'
+                         'first_attitude_id INTEGER )')
+
+    # indexes on the columns the queries in queries.sql join on, built once the data is in
+    def create_indexes(self):
+        for index in self.INDEXES:
+            self.cur.execute(index)
+
+    # keep_journal leaves the rollback journal on disk, so that a killed process can't leave
+    # a half-written transaction behind
+    def begin_bulk_load(self, keep_journal=False):
+        # the synchronous pragma can't change inside a transaction
+        self.con.commit()
+        for pragma in self.BULK_LOAD_PRAGMAS:
+            if keep_journal and pragma.startswith('PRAGMA journal_mode'):
+                continue
+            self.cur.execute(pragma)
+
+    # foreign keys are checked once, over the finished tables, with foreign_key_check (nothing
+    # checks them during the load); returns the number of violations
+    def end_bulk_load(self):
+        self.con.commit()
+        violations = self.cur.execute('PRAGMA foreign_key_check').fetchall()
+        self.cur.execute('PRAGMA journal_mode = DELETE')
+        self.cur.execute('PRAGMA synchronous = FULL')
+        return len(violations)
+
+    # reindexing the full-text tables from sentences and mentions, which also drops whatever rows an
+    # incremental build deleted; FTS5 builds the whole index faster than it takes rows one at a time
+    def rebuild_search(self):
+        self.cur.execute("INSERT INTO sentence_search (sentence_search) VALUES ('rebuild')")
+        self.cur.execute("INSERT INTO mention_search (mention_search) VALUES ('rebuild')")
+
+    # refreshing the planner's statistics, so that it actually picks the indexes above
+    def analyze(self):
+        self.cur.execute('ANALYZE')
+
     def clear_database(self):
+        self.cur.execute('DROP TABLE mention_search')
+        self.cur.execute('DROP TABLE sentence_search')
+        self.cur.execute('DROP TABLE attitude_span')
+        self.cur.execute('DROP TABLE attitude_basic')
+        self.cur.execute('DROP TABLE checkpoint')
+        self.cur.execute('DROP TABLE id_counters')
+        self.cur.execute('DROP TABLE file_fingerprints')
+        self.cur.execute('DROP TABLE errors')
+        self.cur.execute('DROP TABLE source_ancestors')
         self.cur.execute('DROP TABLE attitudes')
         self.cur.execute('DROP TABLE sources')
         self.cur.execute('DROP TABLE mentions')
@@ -4,8 +4,15 @@
 import sqlite3
 from ddl import DDL
 from fb_sentence_processor import FbSentenceProcessor
-from progress.bar import Bar
-from time import time
+from fb_parallel import process_parallel
+from fb_pipeline import process_pipelined
+from fb_staging import FbStaging
+from fb_incremental import IncrementalBuild, fingerprint_files
+from fb_views import refresh_views
+from metrics import Metrics, ProgressBarSink, JsonLinesSink, SummaryTableSink
+from time import time, perf_counter
+from urllib.request import pathname2url
+import argparse
 
 
 class FB2Master:
@@ -17,32 +24,147 @@ class FB2Master:
     RAW_OFFSET_INIT = 2
     REL_SOURCE_TEXT = 3
 
+    # every stage is timed as 'stage.<name>'; convert is the whole of load_data, and so encloses parse
+    # and align (from the sentence processor) and insert (accumulated across batched writes) rather
+    # than adding to them; views refreshes the precomputed attitude tables, search reindexes the
+    # full-text tables and finish covers the bulk-load check and ANALYZE
+    STAGES = ['plan', 'load', 'convert', 'parse', 'align', 'insert', 'index', 'uu_to_rob', 'errors', 'views',
+              'search', 'finish']
+
+    # ways of reading factbank_data.db, which the converter never writes to: 'file' is an ordinary
+    # read-write connection, 'mmap' opens it read-only with a memory-mapped window of MMAP_SIZE bytes
+    # (pages are read straight out of the OS page cache instead of being copied into SQLite's), and
+    # 'memory' copies the whole database into :memory: with the backup API before anything reads it
+    SOURCE_MODES = ['file', 'mmap', 'memory']
+    MMAP_SIZE = 1 << 30
+
     # constructor
-    def __init__(self):
-        # connecting to origin and destination database files
-        self.fb_con = sqlite3.connect("factbank_data.db")
+    def __init__(self, batch_size=256, workers=1, parse_cache=None, staged=False, flush_size=0,
+                 bulk_load=False, metrics=None, incremental=False, checkpoint=False, resume=False,
+                 pipeline=False, parse_workers=0, queue_size=4, source_mode='mmap', shard=None):
+        # options are checked before anything is opened, since opening the master database for a
+        # fresh build deletes the existing one
+        self.check_options(workers, staged, pipeline, source_mode, shard)
+
+        # timers, counters and progress, reported through the metrics' sinks (progress bars by default)
+        self.metrics = metrics if metrics is not None else Metrics([ProgressBarSink()])
+
+        # connecting to origin and destination database files; a pipelined conversion reads
+        # FactBank and writes the master database from threads of its own
+        self.source_mode = source_mode
+        self.fb_con = self.open_source("factbank_data.db", source_mode, shared=pipeline)
         self.fb_cur = self.fb_con.cursor()
 
-        self.create_tables()
-        self.ma_con = sqlite3.connect("fb_master.db")
-        self.ma_cur = self.ma_con.cursor()
+        # a sharded build, shard = (index, count), converts only the index-th of count groups of
+        # FactBank files into fb_shard<index>_master.db, with IDs of its own; see fb_merge.py
+        self.shard = shard
+
+        # initializing the DDL for the master schema, and writing through its connection;
+        # an incremental build keeps the existing database and converts only changed files,
+        # and a resumed one carries on from the last checkpoint an unfinished build left
+        name = 'fb' if shard is None else 'fb_shard{}'.format(shard[0])
+        self.ddl = DDL(name, overwrite=not (incremental or resume), shared=pipeline)
+        self.ddl.create_tables()
+        self.ma_con = self.ddl.con
+        self.ma_cur = self.ddl.cur
+        self.bulk_load = bulk_load
+        # without a checkpoint to resume from, a resumed build is an incremental one
+        self.incremental = incremental or resume
+        self.resume = resume
+        self.build = IncrementalBuild(self.ma_con)
+        self.fingerprints = {}
+        self.changed_files = []
+        self.removed_files = []
+        # the first ID handed out per table, past everything already in the database, and the
+        # first attitude of the whole build (earlier than first_ids' when resuming)
+        self.first_ids = {}
+        self.first_attitude_id = 1
+        # conditions (and their parameters) on the sentence query, see plan
+        self.sentence_filters = []
+        self.sentence_params = []
 
         self.initial_offsets = {}
         self.final_offsets = {}
-        self.errors = {}
+        self.errors = []
         self.num_errors = 0
         self.rel_source_texts = {}
         self.source_offsets = {}
         self.target_offsets = {}
         self.fact_values = {}
         self.targets = {}
+        self.batch_size = batch_size
+        self.workers = workers
+        self.parse_cache = parse_cache
+        # streaming mode: sentences are read from a cursor and written out every flush_size sentences;
+        # checkpointing commits each of those writes along with how far the conversion got
+        self.checkpoint = checkpoint or resume
+        if (self.checkpoint or pipeline) and not flush_size:
+            flush_size = 1000
+        self.flush_size = flush_size
+
+        # pipelined mode: reading, parsing (in parse_workers processes, if any), aligning and writing
+        # run as stages joined by queues of queue_size batches, see fb_pipeline.py
+        self.pipeline = pipeline
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+
+        # staged loading normalises FactBank inside SQLite instead of into the dictionaries above;
+        # with the mmap source mode, the attached database is read-only and memory-mapped as well
+        self.staging = FbStaging(self.ma_con, read_only=source_mode == 'mmap',
+                                 mmap_size=self.MMAP_SIZE if source_mode == 'mmap' else 0) if staged else None
 
         # queries to be used throughout program
         self.fb_sentences_query = """
         SELECT DISTINCT s.file, s.sentid, s.sent
-        FROM sentences s
+        FROM sentences s{}
         ORDER BY s.file, s.sentid;"""
         self.offsets_query = """SELECT o.file, o.sentId, o.offsetInit FROM offsets o WHERE o.tokLoc = 0;"""
+        self.count_sentences_query = """
+        SELECT COUNT(*) FROM (SELECT DISTINCT s.file, s.sentid, s.sent FROM sentences s{}) WHERE sentid != 0;"""
+
+    # raising ValueError for options that cannot be combined
+    @classmethod
+    def check_options(cls, workers, staged, pipeline, source_mode, shard):
+        if source_mode not in cls.SOURCE_MODES:
+            raise ValueError('unknown source mode {!r}, expected one of {}'.format(source_mode, cls.SOURCE_MODES))
+        if pipeline and workers > 1:
+            raise ValueError('the pipeline runs a single aligning stage and cannot be combined with '
+                             'multiple workers; use --parse-workers to parse in parallel')
+        if pipeline and staged:
+            raise ValueError('staged loading reads through the master connection, which the pipeline '
+                             'hands to its writer thread')
+        if staged and workers > 1:
+            raise ValueError('staged loading reads through the master connection and cannot be '
+                             'combined with multiple workers')
+        if staged and source_mode == 'memory':
+            raise ValueError('staged loading attaches factbank_data.db to the master connection, so it '
+                             'cannot read an in-memory copy; use the file or mmap source mode')
+        if shard is not None and not 0 <= shard[0] < shard[1]:
+            raise ValueError('shard index {} is not between 0 and the shard count {}'.format(*shard))
+
+    # a connection to the FactBank database at path, opened as the source mode says and timed as
+    # 'source.open'; shared lets other threads use it
+    def open_source(self, path, mode, shared=False):
+        if mode not in self.SOURCE_MODES:
+            raise ValueError('unknown source mode {!r}, expected one of {}'.format(mode, self.SOURCE_MODES))
+        start = perf_counter()
+        if mode == 'file':
+            con = sqlite3.connect(path, check_same_thread=not shared)
+        else:
+            # mode=ro also refuses to create an empty database when path doesn't exist
+            source = sqlite3.connect('file:{}?mode=ro'.format(pathname2url(path)), uri=True,
+                                     check_same_thread=not shared)
+            if mode == 'mmap':
+                source.execute('PRAGMA mmap_size = {}'.format(self.MMAP_SIZE))
+                con = source
+            else:
+                con = sqlite3.connect(':memory:', check_same_thread=not shared)
+                source.backup(con)
+                source.close()
+        seconds = perf_counter() - start
+        self.metrics.add_time('source.open', seconds)
+        self.metrics.emit('source', mode=mode, seconds=round(seconds, 4))
+        return con
 
     # since FactBank's offsets are file-based, we need to convert them to sentence-based
     def load_initial_offsets(self):
@@ -51,6 +173,13 @@ class FB2Master:
         for row in offsets_sql_return:
             self.initial_offsets[(row[self.FILE], row[self.SENTENCE_ID])] = row[self.RAW_OFFSET_INIT]
 
+    # rebasing a file-based offset to the sentence, see load_initial_offsets
+    def rebase(self, key, offset):
+        file_offset = self.initial_offsets.get(key)
+        if offset is None or file_offset is None:
+            return None
+        return offset - file_offset
+
     # building a dictionary of every relSourceText from FactBank, mapping them to the associated sentence
     def load_rel_source_texts(self):
         rel_source_data = self.fb_cur.execute('SELECT file, sentId, '
@@ -72,75 +201,217 @@ class FB2Master:
             'AND s.sourceLoc = o.tokLoc;')
         for row in source_offsets_data:
             key = (row[self.FILE], row[self.SENTENCE_ID])
-            value = (row[2], row[3], str(row[4])[1:-2])
+            value = (self.rebase(key, row[2]), self.rebase(key, row[3]), str(row[4])[1:-2])
             self.source_offsets[key] = value
 
-    # loading all targets and fact values from factbank to a Python dictionary
+    # loading all targets from factbank to a Python dictionary, joined to their offsets;
+    # load_target_offsets must run first
     def load_targets(self):
         targets_raw = self.fb_cur.execute('SELECT o.file, o.sentId, o.tmlTagId, o.tokLoc, t.eText from tokens_tml o '
                                           'JOIN fb_factValue t ON o.file = t.file '
                                           'AND o.sentId = t.sentId AND o.tmlTagId = t.eId;').fetchall()
         for row in targets_raw:
             target_key = (row[0], row[1], row[2])
-            self.targets[target_key] = [row[3], row[4]]
+            target_offset_key = (row[0], row[1], row[3])
+            if target_offset_key not in self.target_offsets:
+                continue
+            offset_start, offset_end = self.target_offsets[target_offset_key]
+            self.targets[target_key] = (row[4][1:-1].replace("\\", ""), offset_start, offset_end)
+
+        # the offsets are only needed for the join
+        self.target_offsets = {}
 
     def load_target_offsets(self):
         target_offsets_raw = self.fb_cur.execute('SELECT file, sentId, tokLoc, '
                                                  'offsetInit, offsetEnd FROM offsets;').fetchall()
         for row in target_offsets_raw:
             target_offset_key = (row[0], row[1], row[2])
-            self.target_offsets[target_offset_key] = [row[3], row[4]]
+            sentence_key = (row[0], row[1])
+            self.target_offsets[target_offset_key] = [self.rebase(sentence_key, row[3]),
+                                                      self.rebase(sentence_key, row[4])]
 
     def load_fact_values(self):
         fact_values_raw = self.fb_cur.execute('SELECT file, sentId, relSourceId, '
                                               'eId, factValue FROM fb_factValue;').fetchall()
         for row in fact_values_raw:
-            fact_value_key = (row[0], row[1], row[2])
+            fact_value_key = (row[0], row[1], row[2][1:-1])
             if fact_value_key in self.fact_values:
-                self.fact_values[fact_value_key].append((row[3], row[4]))
+                self.fact_values[fact_value_key].append((row[3], row[4][1:-2]))
             else:
-                self.fact_values[fact_value_key] = [(row[3], row[4])]
+                self.fact_values[fact_value_key] = [(row[3], row[4][1:-2])]
+
+    # seconds per conversion stage, e.g. for the benchmark harness
+    def stage_timings(self):
+        return {stage: self.metrics.seconds('stage.' + stage) for stage in self.STAGES}
+
+    # running one conversion stage under its timer and reporting it to the sinks
+    def run_stage(self, stage, function):
+        with self.metrics.timer('stage.' + stage):
+            function()
+        self.metrics.emit('stage', stage=stage, seconds=round(self.metrics.seconds('stage.' + stage), 4))
+
+    # fingerprinting every FactBank file and, for an incremental build, clearing out the rows of
+    # the files that changed and restricting the conversion to them; a resumed build did its
+    # clearing before its first checkpoint, and only skips past the sentences already committed
+    def plan(self):
+        self.fingerprints = fingerprint_files(self.fb_cur)
+        if self.shard is not None:
+            # as far as a shard is concerned, FactBank holds only its own group of files
+            group = self.shard_files(sorted(self.fingerprints))
+            print('Shard {} of {}: {} of {} files'.format(self.shard[0], self.shard[1], len(group),
+                                                          len(self.fingerprints)))
+            self.fingerprints = {file: self.fingerprints[file] for file in group}
+        self.changed_files, self.removed_files = self.build.plan(self.fingerprints)
+        checkpoint = self.build.load_checkpoint() if self.resume else None
+        if checkpoint is not None:
+            (file, sent_id), self.first_ids, self.first_attitude_id = checkpoint
+            print('Resuming after {} sentence {}'.format(file, sent_id))
+            self.select_files(self.changed_files)
+            self.sentence_filters.append('(s.file > ? OR (s.file = ? AND s.sentid > ?))')
+            self.sentence_params += [file, file, sent_id]
+            return
+
+        if self.incremental:
+            print('{} of {} files changed, {} removed'.format(len(self.changed_files), len(self.fingerprints),
+                                                             len(self.removed_files)))
+            self.build.delete_files(self.changed_files + self.removed_files)
+        if self.incremental or self.shard is not None:
+            self.select_files(self.changed_files)
+        self.first_ids = self.build.next_ids()
+        self.first_attitude_id = self.first_ids['attitudes']
+
+    # this shard's group out of every (sorted) FactBank file: groups are contiguous runs of files of
+    # near-equal size, so that shards merged in order number their rows as a single build would
+    def shard_files(self, files):
+        index, count = self.shard
+        return files[len(files) * index // count:len(files) * (index + 1) // count]
+
+    # committing a checkpoint after each streamed write
+    def save_checkpoint(self, position, next_ids):
+        self.build.save_checkpoint(position, next_ids, self.first_attitude_id)
 
-    # initializing the DDL for the master schema
-    @staticmethod
-    def create_tables():
-        db = DDL('fb')
-        db.create_tables()
-        db.close()
+    # the sentence query runs on the master connection when staged (FactBank is attached there)
+    def sentence_cursor(self):
+        return self.ma_cur if self.staging is not None else self.fb_cur
+
+    def select_files(self, files):
+        cur = self.sentence_cursor()
+        cur.execute('CREATE TEMP TABLE IF NOT EXISTS selected_files (file PRIMARY KEY)')
+        cur.execute('DELETE FROM temp.selected_files')
+        cur.executemany('INSERT OR IGNORE INTO temp.selected_files VALUES (?)', [(file,) for file in files])
+        self.sentence_filters.append('s.file IN (SELECT file FROM temp.selected_files)')
+
+    # filling in the sentence filters, and pointing at the attached database when staged
+    def sentence_query(self, query):
+        query = query.format(' WHERE ' + ' AND '.join(self.sentence_filters) if self.sentence_filters else '')
+        if self.staging is not None:
+            query = query.replace('FROM sentences', 'FROM fb.sentences')
+        return query
+
+    # the number of sentences the processor will see, so that progress is sized from the data
+    def count_sentences(self):
+        return self.sentence_cursor().execute(self.sentence_query(self.count_sentences_query),
+                                              self.sentence_params).fetchone()[0]
 
     # retrieving every sentence and populating its tokens, sources and attitudes
     def load_data(self):
+        num_sentences = self.count_sentences()
+        self.metrics.count('sentences.read', num_sentences)
+
+        if self.staging is not None:
+            sentences_sql_return = self.staging.sentences(self.sentence_query(self.fb_sentences_query),
+                                                          self.sentence_params)
+            lookups = self.staging.lookups()
+        else:
+            sentences_sql_return = self.fb_cur.execute(self.sentence_query(self.fb_sentences_query),
+                                                       self.sentence_params)
+            if not self.flush_size:
+                sentences_sql_return = sentences_sql_return.fetchall()
+            lookups = (self.rel_source_texts, self.source_offsets, self.targets, self.fact_values)
 
-        sentences_sql_return = self.fb_cur.execute(self.fb_sentences_query).fetchall()
-        sp = FbSentenceProcessor(sentences_sql_return, self.initial_offsets, self.rel_source_texts,
-                                 self.source_offsets, self.target_offsets, self.targets, self.fact_values)
+        writer = self.insert_rows if self.flush_size else None
+        checkpoint = self.save_checkpoint if self.checkpoint else None
+        if self.pipeline:
+            sp = process_pipelined(sentences_sql_return, lookups, writer, batch_size=self.batch_size,
+                                   parse_cache=self.parse_cache, parse_workers=self.parse_workers,
+                                   queue_size=self.queue_size, flush_size=self.flush_size, metrics=self.metrics,
+                                   num_sentences=num_sentences, first_ids=self.first_ids, checkpoint=checkpoint)
+        elif self.workers > 1:
+            sp = process_parallel(sentences_sql_return, lookups, self.workers, batch_size=self.batch_size,
+                                  parse_cache=self.parse_cache, writer=writer, metrics=self.metrics,
+                                  first_ids=self.first_ids, checkpoint=checkpoint)
+        else:
+            sp = FbSentenceProcessor(sentences_sql_return, *lookups, batch_size=self.batch_size,
+                                     parse_cache=self.parse_cache, flush_size=self.flush_size, writer=writer,
+                                     metrics=self.metrics, num_sentences=num_sentences, first_ids=self.first_ids,
+                                     checkpoint=checkpoint)
+            sp.go()
 
-        sp.go()
+        self.errors, self.num_errors = sp.errors, sp.num_errors
+        if self.staging is not None:
+            self.staging.close()
 
-        final_attitudes = []
-        for key in sp.attitudes:
-            current_attitudes_list = sp.attitudes[key]
-            for item in current_attitudes_list:
-                final_attitudes.append(item)
+        # in streaming mode everything but the errors has been written already
+        if writer is None:
+            self.insert_rows(sp.sentences, sp.mentions, sp.sources, sp.source_ancestors, sp.attitudes)
 
-        self.errors, self.num_errors = sp.get_errors()
+    # inserting python data into master schema; streamed writes carry their errors along,
+    # otherwise they are written by load_errors
+    def insert_rows(self, sentences, mentions, sources, source_ancestors, attitudes, errors=None):
+        with self.metrics.timer('stage.insert'):
+            self.write_rows(sentences, mentions, sources, source_ancestors, attitudes)
+            if errors:
+                self.write_errors(errors)
+        for table, rows in [('sentences', sentences), ('mentions', mentions), ('sources', sources),
+                            ('source_ancestors', source_ancestors), ('attitudes', attitudes)]:
+            self.metrics.count('rows.' + table, len(rows))
 
-        # inserting python data into master schema
+    def write_rows(self, sentences, mentions, sources, source_ancestors, attitudes):
         self.ma_con.executemany('INSERT INTO SENTENCES (sentence_id, file, file_sentence_id, sentence) '
-                                'VALUES (?, ?, ?, ?);', sp.sentences)
+                                'VALUES (?, ?, ?, ?);', sentences)
         self.ma_con.executemany('INSERT INTO mentions '
                                 '(token_id, sentence_id, token_text, token_offset_start, '
                                 'token_offset_end, phrase_text, phrase_offset_start, phrase_offset_end) '
-                                'VALUES (?, ?, ?, ?, ?, ?, ?, ?);', sp.mentions)
+                                'VALUES (?, ?, ?, ?, ?, ?, ?, ?);', mentions)
         self.ma_con.executemany('INSERT INTO sources '
                                 '(source_id, sentence_id, token_id, parent_source_id, nesting_level, [source]) '
-                                'VALUES (?, ?, ?, ?, ?, ?);', sp.sources)
+                                'VALUES (?, ?, ?, ?, ?, ?);', sources)
+        self.ma_con.executemany('INSERT INTO source_ancestors (source_id, ancestor_source_id, depth) '
+                                'VALUES (?, ?, ?);', source_ancestors)
         self.ma_con.executemany('INSERT INTO attitudes '
                                 '(attitude_id, source_id, target_token_id, label, label_type) '
-                                'VALUES (?, ?, ?, ?, ?);', final_attitudes)
+                                'VALUES (?, ?, ?, ?, ?);', attitudes)
+
+    # changing relevant Uu labels to ROB (reported belief)
+    # in order to more closely match the BEST corpus' annotation style
+    # if bottom of source structure is NOT Uu (GEN and DUMMY do trigger this algo), go up the source tree,
+    # for each intermediate source including the very top, switch Uu to ROB, for the target gotten from the bottom
+    """
+    for each attitude:
+        if label is not Uu:
+            for each strict ancestor of its source (via source_ancestors), find the attitudes with the
+            same target_token_id, and if the label is Uu, change it to ROB
+    """
+    # this runs as a single set-based UPDATE over the closure table, once every row is in and indexed;
+    # sources never span sentences, so only the attitudes added by this build need to be visited
+    def uu_to_rob(self):
+        self.ma_cur.execute("UPDATE attitudes SET label = 'ROB' "
+                            "WHERE attitude_id IN ("
+                            "SELECT a.attitude_id FROM attitudes b "
+                            "JOIN source_ancestors sa ON sa.source_id = b.source_id AND sa.depth > 0 "
+                            "JOIN attitudes a ON a.source_id = sa.ancestor_source_id "
+                            "AND a.target_token_id = b.target_token_id "
+                            "WHERE b.attitude_id >= ? AND b.label IS NOT 'Uu' AND a.label = 'Uu')",
+                            (self.first_attitude_id,))
+        self.metrics.count('uu_to_rob.changed', self.ma_cur.rowcount)
+        print('{} changes from Uu to ROB'.format(self.ma_cur.rowcount))
+
+    # bringing attitude_basic and attitude_span in line with the rows this build wrote and deleted
+    def refresh_views(self):
+        for table, added in refresh_views(self.ma_cur).items():
+            self.metrics.count('rows.' + table, added)
 
     def commit(self):
-        self.fb_con.commit()
         self.ma_con.commit()
 
     def close(self):
@@ -148,59 +419,140 @@ class FB2Master:
         self.fb_con.close()
         self.ma_con.close()
 
-    # if errors exist, catalog them
+    # if errors exist, catalog them; see fb_errors.py for a report over them
     def load_errors(self):
         print('Loading errors...')
-        self.ma_cur.execute('CREATE TABLE errors ('
-                            'error_id INTEGER PRIMARY KEY AUTOINCREMENT,'
-                            'file VARCHAR2(255),'
-                            'file_sentence_id INTEGER,'
-                            'offset_start INTEGER,'
-                            'offset_end INTEGER,'
-                            'predicted_head VARCHAR2(255),'
-                            'head VARCHAR2(255),'
-                            'raw_sentence VARCHAR2(255),'
-                            'result_sentence VARCHAR2(255),'
-                            'rel_source_text VARCHAR2(255) )')
         if self.num_errors == 0:
             print('0 errors; Data integrity verified.')
         else:
-            bar = Bar('Errors Processed', max=self.num_errors)
-            for key in self.errors:
-                self.ma_cur.executemany('INSERT INTO errors (file, file_sentence_id, offset_start, '
-                                        'offset_end, predicted_head, head, '
-                                        'raw_sentence, result_sentence, rel_source_text)'
-                                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', self.errors[key])
-                bar.next()
-            bar.finish()
+            # any errors not already written with their sentences
+            self.write_errors(self.errors)
+            print('{} errors catalogued'.format(self.num_errors))
+        self.metrics.count('rows.errors', self.num_errors)
+
+    # every error in one batch; errors.result_sentence is computed by SQLite
+    def write_errors(self, entries):
+        self.ma_cur.executemany('INSERT INTO errors (file, file_sentence_id, offset_start, '
+                                'offset_end, predicted_head, head, '
+                                'raw_sentence, rel_source_text)'
+                                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', entries)
+
+    def load(self):
+        if self.staging is not None:
+            print("Staging Factbank data inside SQLite...")
+            self.staging.build()
+            return
 
-    def generate_database(self):
         print("Loading Factbank data into Python data structures...")
-        bar = Bar('Data Imported', max=6)
-        self.load_targets()
-        bar.next()
-        self.load_target_offsets()
-        bar.next()
-        self.load_fact_values()
-        bar.next()
-        self.load_initial_offsets()
-        bar.next()
-        self.load_rel_source_texts()
-        bar.next()
-        self.load_source_offsets()
-        bar.next()
-        bar.finish()
+        # initial offsets first, since the others are rebased against them
+        loaders = [self.load_initial_offsets, self.load_target_offsets, self.load_targets,
+                   self.load_fact_values, self.load_rel_source_texts, self.load_source_offsets]
+        progress = self.metrics.progress('Data Imported', len(loaders))
+        for loader in loaders:
+            with self.metrics.timer(loader.__name__):
+                loader()
+            progress.next()
+        progress.finish()
 
-        print('\nLoading data into master schema...')
-        self.load_data()
-        self.load_errors()
+    def finish(self):
+        self.build.record(self.fingerprints, self.changed_files, self.removed_files)
+        if self.bulk_load:
+            violations = self.ddl.end_bulk_load()
+            if violations:
+                print('Warning: {} foreign key violations'.format(violations))
+        self.ddl.analyze()
         self.close()
 
+    def generate_database(self):
+        if self.bulk_load:
+            # checkpoints must survive the process dying mid-write, so their journal stays on disk
+            self.ddl.begin_bulk_load(keep_journal=self.checkpoint)
+
+        self.run_stage('plan', self.plan)
+        if self.incremental and not self.changed_files and not self.removed_files:
+            print('Every file is up to date.')
+            # a database built before the attitude and search tables existed still gets them filled in
+            self.run_stage('index', self.ddl.create_indexes)
+            self.run_stage('views', self.refresh_views)
+            self.run_stage('search', self.ddl.rebuild_search)
+            self.run_stage('finish', self.finish)
+            self.metrics.close()
+            return
+
+        self.run_stage('load', self.load)
+        print('Read factbank_data.db in {} mode: opened in {:.3f} sec, loaded in {:.3f} sec'.format(
+            self.source_mode, self.metrics.seconds('source.open'), self.metrics.seconds('stage.load')))
+
+        print('\nLoading data into master schema...')
+        self.run_stage('convert', self.load_data)
+        self.run_stage('index', self.ddl.create_indexes)
+        self.run_stage('uu_to_rob', self.uu_to_rob)
+        self.run_stage('errors', self.load_errors)
+        self.run_stage('views', self.refresh_views)
+        self.run_stage('search', self.ddl.rebuild_search)
+        self.run_stage('finish', self.finish)
+        self.metrics.close()
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Convert FactBank into the master schema.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes to shard the conversion across, by FactBank file')
+    parser.add_argument('--batch-size', type=int, default=256,
+                        help='number of sentences parsed by spaCy at once (0 parses one at a time)')
+    parser.add_argument('--parse-cache', nargs='?', const='fb_parse_cache.db', default=None,
+                        help='reuse spaCy parses stored in this file (default: fb_parse_cache.db)')
+    parser.add_argument('--staged', action='store_true',
+                        help='ATTACH factbank_data.db and normalise it in SQLite staging tables '
+                             'instead of Python dictionaries')
+    parser.add_argument('--stream', type=int, nargs='?', const=1000, default=0, metavar='FLUSH_SIZE',
+                        help='stream sentences from a cursor and write them out every FLUSH_SIZE sentences '
+                             '(default: 1000); combine with --staged to keep memory flat')
+    parser.add_argument('--bulk-load', action='store_true',
+                        help='relax journaling and syncing while writing, checking foreign keys once at the end')
+    parser.add_argument('--incremental', action='store_true',
+                        help='keep an existing fb_master.db and reconvert only the FactBank files '
+                             'whose rows changed since it was built')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='commit every streamed write together with a checkpoint (implies --stream)')
+    parser.add_argument('--resume', action='store_true',
+                        help='carry on from the checkpoint an interrupted --checkpoint run left in fb_master.db '
+                             '(without one, the same as --incremental)')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='read, parse, align and write in concurrent stages joined by bounded queues, '
+                             'reporting how full each queue ran (implies --stream)')
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help='with --pipeline, parse in this many processes (default: parse in a thread)')
+    parser.add_argument('--queue-size', type=int, default=4,
+                        help='with --pipeline, the capacity of each queue, in batches of --batch-size sentences')
+    parser.add_argument('--source-mode', choices=FB2Master.SOURCE_MODES, default='mmap',
+                        help='how to read factbank_data.db: an ordinary connection (file), read-only and '
+                             'memory-mapped (mmap, the default), or copied into memory first (memory, '
+                             'not with --staged)')
+    parser.add_argument('--shard', type=int, nargs=2, metavar=('INDEX', 'COUNT'),
+                        help='convert only the INDEX-th (from 0) of COUNT groups of FactBank files, into '
+                             'fb_shard<INDEX>_master.db; combine the shards with fb_merge.py')
+    parser.add_argument('--metrics-jsonl', metavar='PATH',
+                        help='write stage events and a final metrics summary to PATH as JSON lines')
+    parser.add_argument('--metrics-summary', action='store_true',
+                        help='print a table of every timer and counter at the end')
+    parser.add_argument('--no-progress', action='store_true', help='do not draw progress bars')
+    args = parser.parse_args()
+
+    sinks = [] if args.no_progress else [ProgressBarSink()]
+    if args.metrics_jsonl:
+        sinks.append(JsonLinesSink(args.metrics_jsonl))
+    if args.metrics_summary:
+        sinks.append(SummaryTableSink())
+
     print("fb2master.py version 3.0\n\n")
     START_TIME = time()
-    test = FB2Master()
+    test = FB2Master(batch_size=args.batch_size, workers=args.workers,
+                     parse_cache=args.parse_cache, staged=args.staged,
+                     flush_size=args.stream, bulk_load=args.bulk_load, metrics=Metrics(sinks),
+                     incremental=args.incremental, checkpoint=args.checkpoint, resume=args.resume,
+                     pipeline=args.pipeline, parse_workers=args.parse_workers, queue_size=args.queue_size,
+                     source_mode=args.source_mode, shard=args.shard)
     test.generate_database()
     print('\n\nDone.')
     run_time = time() - START_TIME
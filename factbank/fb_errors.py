@@ -0,0 +1,62 @@
+# aggregate report over the errors table of a finished fb_master.db: counts by file, by expected head
+# and by drift, each a single GROUP BY in SQLite rather than a pass over the rows in Python
+
+import argparse
+import sqlite3
+
+# drift: how far the expected head actually sits from FactBank's offset, found ignoring case (the
+# aligner matches case-sensitively, so a head that only differs in case fails); NULL when the head
+# doesn't occur in the sentence at all
+DRIFT = ('CASE WHEN INSTR(LOWER(raw_sentence), LOWER(head)) > 0 '
+         'THEN INSTR(LOWER(raw_sentence), LOWER(head)) - 1 - offset_start END')
+
+
+class ErrorReport:
+
+    def __init__(self, master='fb_master.db'):
+        self.con = sqlite3.connect(master)
+
+    def total(self):
+        return self.con.execute('SELECT COUNT(*) FROM errors').fetchone()[0]
+
+    # [(file, errors, sentences with errors)], most errors first
+    def by_file(self, limit=None):
+        return self.con.execute('SELECT file, COUNT(*), COUNT(DISTINCT file_sentence_id) FROM errors '
+                                'GROUP BY file ORDER BY 2 DESC, 1 LIMIT ?',
+                                (-1 if limit is None else limit,)).fetchall()
+
+    # [(head, errors, files)], most errors first
+    def by_head(self, limit=None):
+        return self.con.execute('SELECT head, COUNT(*), COUNT(DISTINCT file) FROM errors '
+                                'GROUP BY head ORDER BY 2 DESC, 1 LIMIT ?',
+                                (-1 if limit is None else limit,)).fetchall()
+
+    # [(drift, errors)], with a drift of None for heads missing from their sentence, most errors first
+    def by_drift(self, limit=None):
+        return self.con.execute('SELECT {} drift, COUNT(*) FROM errors '
+                                'GROUP BY drift ORDER BY 2 DESC, 1 LIMIT ?'.format(DRIFT),
+                                (-1 if limit is None else limit,)).fetchall()
+
+    def close(self):
+        self.con.close()
+
+
+def print_table(title, header, rows):
+    print('\n' + title)
+    print('  '.join('{:>12}'.format(column) for column in header))
+    for row in rows:
+        print('  '.join('{:>12}'.format(str(value)) for value in row))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Summarise the alignment errors in fb_master.db.')
+    parser.add_argument('--master', default='fb_master.db')
+    parser.add_argument('--limit', type=int, default=10, help='rows per table')
+    args = parser.parse_args()
+
+    report = ErrorReport(args.master)
+    print('{} errors'.format(report.total()))
+    print_table('By file', ['file', 'errors', 'sentences'], report.by_file(args.limit))
+    print_table('By head', ['head', 'errors', 'files'], report.by_head(args.limit))
+    print_table('By drift (None: head not in sentence)', ['drift', 'errors'], report.by_drift(args.limit))
+    report.close()
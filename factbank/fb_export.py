@@ -0,0 +1,168 @@
+# columnar export of the joined attitude view (the SPAN QUERY in queries.sql, as precomputed in the
+# attitude_span table, see fb_views.py): one row per attitude with its source and target heads,
+# offsets, phrase spans, nesting level and label, written in chunks
+# as a Parquet file (needs pyarrow) and as memory-mapped .npy arrays that training loaders can
+# np.load(..., mmap_mode='r') without touching SQLite
+
+import argparse
+import json
+import sqlite3
+from os import makedirs
+from os.path import join
+import numpy as np
+from fb_views import refresh_views
+
+# attitude_span's columns, renamed where the export's differ
+EXPORT_QUERY = """
+SELECT attitude_id, sentence_id, file, file_sentence_id, source_id, parent_source_id, nesting_level,
+       source_text source_head, source_offset_start, source_offset_end, source_span_start, source_span_end,
+       source_span, target_token target_token_id, target_head, target_offset_start, target_offset_end,
+       target_span_start, target_span_end, target_span, label
+FROM attitude_span
+ORDER BY attitude_id"""
+
+# (column, Arrow type name) in query order
+COLUMNS = [('attitude_id', 'int64'), ('sentence_id', 'int64'), ('file', 'string'), ('file_sentence_id', 'int32'),
+           ('source_id', 'int64'), ('parent_source_id', 'int64'), ('nesting_level', 'int8'),
+           ('source_head', 'string'), ('source_offset_start', 'int32'), ('source_offset_end', 'int32'),
+           ('source_span_start', 'int32'), ('source_span_end', 'int32'), ('source_span', 'string'),
+           ('target_token_id', 'int64'), ('target_head', 'string'),
+           ('target_offset_start', 'int32'), ('target_offset_end', 'int32'),
+           ('target_span_start', 'int32'), ('target_span_end', 'int32'), ('target_span', 'string'),
+           ('label', 'string')]
+COLUMN_INDEX = {name: i for i, (name, _) in enumerate(COLUMNS)}
+
+# the columns of offsets.npy, an (attitudes x 8) int32 matrix; a missing offset (AUTHOR and other
+# sources with no token, whose phrase span is NULL) is stored as -1
+OFFSET_COLUMNS = ['source_offset_start', 'source_offset_end', 'source_span_start', 'source_span_end',
+                  'target_offset_start', 'target_offset_end', 'target_span_start', 'target_span_end']
+
+# one-dimensional arrays, each in its own .npy file
+ID_ARRAYS = [('attitude_ids', 'attitude_id', np.int64), ('sentence_ids', 'sentence_id', np.int64),
+             ('source_ids', 'source_id', np.int64), ('target_token_ids', 'target_token_id', np.int64),
+             ('nesting_levels', 'nesting_level', np.int8)]
+
+
+class ParquetSink:
+
+    def __init__(self, path):
+        # pyarrow is only needed for this sink
+        import pyarrow
+        import pyarrow.parquet
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, type_name)()) for name, type_name in COLUMNS])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        arrays = [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)]
+        self.writer.write_batch(self.pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class NumpySink:
+
+    # num_rows must be known up front, since the arrays are memory-mapped at their final size;
+    # labels is the label dictionary, {label: label ID}
+    def __init__(self, directory, num_rows, labels):
+        self.directory = directory
+        self.labels = labels
+        self.position = 0
+        self.offsets = np.lib.format.open_memmap(join(directory, 'offsets.npy'), mode='w+', dtype=np.int32,
+                                                 shape=(num_rows, len(OFFSET_COLUMNS)))
+        self.label_ids = np.lib.format.open_memmap(join(directory, 'label_ids.npy'), mode='w+', dtype=np.int16,
+                                                   shape=(num_rows,))
+        self.id_arrays = [(np.lib.format.open_memmap(join(directory, name + '.npy'), mode='w+', dtype=dtype,
+                                                     shape=(num_rows,)), COLUMN_INDEX[column])
+                          for name, column, dtype in ID_ARRAYS]
+        self.offset_indexes = [COLUMN_INDEX[column] for column in OFFSET_COLUMNS]
+        self.label_index = COLUMN_INDEX['label']
+
+    def write(self, rows):
+        end = self.position + len(rows)
+        self.offsets[self.position:end] = [[-1 if row[i] is None else row[i] for i in self.offset_indexes]
+                                           for row in rows]
+        self.label_ids[self.position:end] = [self.labels[row[self.label_index]] for row in rows]
+        for array, index in self.id_arrays:
+            array[self.position:end] = [-1 if row[index] is None else row[index] for row in rows]
+        self.position = end
+
+    def close(self):
+        for array in [self.offsets, self.label_ids] + [array for array, _ in self.id_arrays]:
+            array.flush()
+        manifest = {'rows': self.position, 'offset_columns': OFFSET_COLUMNS,
+                    'arrays': ['offsets', 'label_ids'] + [name for name, _, _ in ID_ARRAYS],
+                    'labels': self.labels}
+        with open(join(self.directory, 'manifest.json'), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+
+
+class FbExport:
+
+    # refresh brings attitude_span up to date first (fb2master.py does this after every build)
+    def __init__(self, master='fb_master.db', directory='fb_export', chunk_size=50000, parquet=True, numpy=True,
+                 refresh=False):
+        self.con = sqlite3.connect(master)
+        self.refresh = refresh
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.parquet = parquet
+        self.numpy = numpy
+
+    # the label dictionary, sorted so that label IDs don't depend on the order attitudes were written
+    def load_labels(self):
+        labels = [row[0] for row in self.con.execute('SELECT DISTINCT label FROM attitudes ORDER BY label')]
+        return {label: label_id for label_id, label in enumerate(labels)}
+
+    def export(self):
+        if self.con.execute("SELECT 1 FROM sqlite_master WHERE name = 'attitude_span'").fetchone() is None:
+            raise ValueError('no attitude_span table in this database; bring it up to date with '
+                             'fb2master.py --incremental')
+        if self.refresh:
+            refresh_views(self.con.cursor())
+            self.con.commit()
+        makedirs(self.directory, exist_ok=True)
+        sinks = []
+        if self.parquet:
+            sinks.append(ParquetSink(join(self.directory, 'attitudes.parquet')))
+        if self.numpy:
+            num_rows = self.con.execute('SELECT COUNT(*) FROM ({})'.format(EXPORT_QUERY)).fetchone()[0]
+            sinks.append(NumpySink(self.directory, num_rows, self.load_labels()))
+
+        cur = self.con.execute(EXPORT_QUERY)
+        num_rows = 0
+        while True:
+            rows = cur.fetchmany(self.chunk_size)
+            if not rows:
+                break
+            for sink in sinks:
+                sink.write(rows)
+            num_rows += len(rows)
+
+        for sink in sinks:
+            sink.close()
+        self.con.close()
+        return num_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export the attitude view of fb_master.db as columnar files.')
+    parser.add_argument('--master', default='fb_master.db')
+    parser.add_argument('--output', default='fb_export', help='directory for the exported files')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='rows read and written at a time')
+    parser.add_argument('--no-parquet', action='store_true', help='skip attitudes.parquet (and pyarrow)')
+    parser.add_argument('--no-numpy', action='store_true', help='skip the memory-mapped .npy arrays')
+    parser.add_argument('--refresh', action='store_true',
+                        help='bring attitude_span up to date first (fb2master.py does this after every build)')
+    args = parser.parse_args()
+
+    if not args.no_parquet:
+        try:
+            import pyarrow
+        except ImportError:
+            parser.error('Parquet export needs pyarrow (pip install pyarrow), or pass --no-parquet')
+    exported = FbExport(args.master, args.output, args.chunk_size, parquet=not args.no_parquet,
+                        numpy=not args.no_numpy, refresh=args.refresh).export()
+    print('Exported {} attitudes to {}'.format(exported, args.output))
@@ -0,0 +1,112 @@
+# incremental rebuilds: every FactBank file is fingerprinted from its raw rows, and only files whose
+# fingerprint changed since the last build are deleted from the master database and converted again;
+# IDs are handed out from stored high-water marks, so no ID is ever reused and unchanged rows keep theirs;
+# an unfinished build leaves a checkpoint behind, which a resumed build picks up from
+
+from hashlib import sha1
+
+# every raw table the converter reads, with a total row order so a file always hashes the same way
+FINGERPRINT_QUERIES = [
+    'SELECT file, sentId, sent FROM sentences ORDER BY file, sentId, sent',
+    'SELECT file, sentId, tokLoc, offsetInit, offsetEnd, text FROM offsets '
+    'ORDER BY file, sentId, tokLoc, offsetInit, offsetEnd, text',
+    'SELECT file, sentId, tokLoc, tmlTagId FROM tokens_tml ORDER BY file, sentId, tokLoc, tmlTagId',
+    'SELECT file, sentId, relSourceId, eId, eText, factValue FROM fb_factValue '
+    'ORDER BY file, sentId, relSourceId, eId, eText, factValue',
+    'SELECT file, sentId, relSourceId, relSourceText FROM fb_relSource '
+    'ORDER BY file, sentId, relSourceId, relSourceText',
+    'SELECT file, sentId, sourceLoc FROM fb_source ORDER BY file, sentId, sourceLoc',
+]
+
+# master tables whose IDs are handed out by the converter, with their ID columns
+ID_COLUMNS = [('sentences', 'sentence_id'), ('mentions', 'token_id'), ('sources', 'source_id'),
+              ('attitudes', 'attitude_id')]
+
+
+# {raw file name: hex digest} over the rows of every FactBank table, read through fb_cur
+def fingerprint_files(fb_cur):
+    hashes = {}
+    for table_number, query in enumerate(FINGERPRINT_QUERIES):
+        for row in fb_cur.execute(query):
+            file_hash = hashes.get(row[0])
+            if file_hash is None:
+                file_hash = hashes[row[0]] = sha1()
+            file_hash.update('{}:{!r}\n'.format(table_number, row[1:]).encode('utf-8'))
+    return {file: file_hash.hexdigest() for file, file_hash in hashes.items()}
+
+
+class IncrementalBuild:
+
+    def __init__(self, con):
+        self.con = con
+        self.cur = con.cursor()
+
+    # the fingerprints recorded by the last build, or an empty dictionary for a fresh database
+    def stored_fingerprints(self):
+        return dict(self.cur.execute('SELECT file, fingerprint FROM file_fingerprints'))
+
+    # the files to convert again (new or changed) and the files to drop (no longer in FactBank)
+    def plan(self, fingerprints):
+        stored = self.stored_fingerprints()
+        changed = sorted(file for file, fingerprint in fingerprints.items() if stored.get(file) != fingerprint)
+        removed = sorted(file for file in stored if file not in fingerprints)
+        return changed, removed
+
+    # the first free ID per table: past both the stored high-water mark and anything in the table
+    def next_ids(self):
+        stored = dict(self.cur.execute('SELECT table_name, next_id FROM id_counters'))
+        next_ids = {}
+        for table, column in ID_COLUMNS:
+            current_max = self.cur.execute('SELECT MAX({}) FROM {}'.format(column, table)).fetchone()[0] or 0
+            next_ids[table] = max(stored.get(table, 1), current_max + 1)
+        return next_ids
+
+    def save_next_ids(self):
+        self.cur.executemany('INSERT OR REPLACE INTO id_counters (table_name, next_id) VALUES (?, ?)',
+                             self.next_ids().items())
+
+    # deleting every row that came from the given raw file names, children first; nothing links
+    # sentences, so a file's rows never reference another file's
+    def delete_files(self, files):
+        self.cur.execute('CREATE TEMP TABLE IF NOT EXISTS deleted_files (file PRIMARY KEY)')
+        self.cur.execute('DELETE FROM temp.deleted_files')
+        # the master tables keep file names without FactBank's quotes
+        self.cur.executemany('INSERT OR IGNORE INTO temp.deleted_files VALUES (?)',
+                             [(file[1:-1],) for file in files])
+        sentence_ids = 'SELECT sentence_id FROM sentences WHERE file IN (SELECT file FROM temp.deleted_files)'
+        source_ids = 'SELECT source_id FROM sources WHERE sentence_id IN ({})'.format(sentence_ids)
+
+        self.cur.execute('DELETE FROM attitudes WHERE source_id IN ({})'.format(source_ids))
+        self.cur.execute('DELETE FROM source_ancestors WHERE source_id IN ({})'.format(source_ids))
+        self.cur.execute('DELETE FROM sources WHERE sentence_id IN ({})'.format(sentence_ids))
+        self.cur.execute('DELETE FROM mentions WHERE sentence_id IN ({})'.format(sentence_ids))
+        self.cur.execute('DELETE FROM sentences WHERE file IN (SELECT file FROM temp.deleted_files)')
+        self.cur.execute('DELETE FROM errors WHERE file IN (SELECT file FROM temp.deleted_files)')
+        self.cur.execute('DROP TABLE temp.deleted_files')
+
+    # recording a finished build, which leaves nothing to resume
+    def record(self, fingerprints, changed, removed):
+        self.cur.executemany('INSERT OR REPLACE INTO file_fingerprints (file, fingerprint) VALUES (?, ?)',
+                             [(file, fingerprints[file]) for file in changed])
+        self.cur.executemany('DELETE FROM file_fingerprints WHERE file = ?', [(file,) for file in removed])
+        self.save_next_ids()
+        self.cur.execute('DELETE FROM checkpoint')
+
+    # committing everything written so far together with the position and counters it reached;
+    # position is the raw (file, sentId) of the last sentence written
+    def save_checkpoint(self, position, next_ids, first_attitude_id):
+        self.cur.execute('INSERT OR REPLACE INTO checkpoint (checkpoint_id, file, file_sentence_id, '
+                         'next_sentence_id, next_mention_id, next_source_id, next_attitude_id, first_attitude_id) '
+                         'VALUES (1, ?, ?, ?, ?, ?, ?, ?)',
+                         (position[0], position[1], next_ids['sentences'], next_ids['mentions'],
+                          next_ids['sources'], next_ids['attitudes'], first_attitude_id))
+        self.con.commit()
+
+    # (position, next_ids, first_attitude_id) from the last checkpoint, or None if the last build finished
+    def load_checkpoint(self):
+        row = self.cur.execute('SELECT file, file_sentence_id, next_sentence_id, next_mention_id, '
+                               'next_source_id, next_attitude_id, first_attitude_id FROM checkpoint').fetchone()
+        if row is None:
+            return None
+        next_ids = {'sentences': row[2], 'mentions': row[3], 'sources': row[4], 'attitudes': row[5]}
+        return (row[0], row[1]), next_ids, row[6]
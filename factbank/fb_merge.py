@@ -0,0 +1,126 @@
+# merging shard databases (fb2master.py --shard INDEX COUNT) into a single master database: each shard
+# is ATTACHed in turn and copied over table by table with INSERT ... SELECT, its IDs shifted past the
+# shards before it; the indexes, the attitude tables, the full-text tables and the planner's
+# statistics are built once, after the last shard is in
+#
+# shards are merged in the order of their files, so shards of a fresh build merge into exactly the
+# database (IDs included) a single build over the whole of FactBank would have written
+
+import argparse
+import sqlite3
+from time import perf_counter
+from urllib.request import pathname2url
+from ddl import DDL
+from fb_incremental import IncrementalBuild, ID_COLUMNS
+from fb_views import refresh_views
+
+# (table, columns, SELECT expressions over the shard's table); :sentences, :mentions, :sources and
+# :attitudes are the ID offsets of the shard being merged. Rows are copied in the shard's order, so
+# that error IDs, left to AUTOINCREMENT, follow it as well
+MERGE_QUERIES = [
+    ('sentences', 'sentence_id, file, file_sentence_id, sentence',
+     'sentence_id + :sentences, file, file_sentence_id, sentence'),
+    ('mentions', 'token_id, sentence_id, token_text, token_offset_start, token_offset_end, phrase_text, '
+                 'phrase_offset_start, phrase_offset_end',
+     'token_id + :mentions, sentence_id + :sentences, token_text, token_offset_start, token_offset_end, '
+     'phrase_text, phrase_offset_start, phrase_offset_end'),
+    # top-level sources have no parent, which is NULL or -1
+    ('sources', 'source_id, sentence_id, token_id, parent_source_id, nesting_level, [source]',
+     'source_id + :sources, sentence_id + :sentences, token_id + :mentions, '
+     'CASE WHEN parent_source_id IS NULL OR parent_source_id = -1 THEN parent_source_id '
+     'ELSE parent_source_id + :sources END, nesting_level, [source]'),
+    ('source_ancestors', 'source_id, ancestor_source_id, depth',
+     'source_id + :sources, ancestor_source_id + :sources, depth'),
+    ('attitudes', 'attitude_id, source_id, target_token_id, label, label_type',
+     'attitude_id + :attitudes, source_id + :sources, target_token_id + :mentions, label, label_type'),
+    ('errors', 'file, file_sentence_id, offset_start, offset_end, predicted_head, head, raw_sentence, '
+               'rel_source_text',
+     'file, file_sentence_id, offset_start, offset_end, predicted_head, head, raw_sentence, rel_source_text'),
+    ('file_fingerprints', 'file, fingerprint', 'file, fingerprint'),
+]
+
+
+class ShardMerge:
+
+    # shards are paths to shard databases, in any order; the merged database is name + '_master.db',
+    # overwritten if it exists
+    def __init__(self, shards, name='fb'):
+        self.shards = self.order(shards)
+        self.ddl = DDL(name)
+        self.ddl.create_tables()
+        self.con = self.ddl.con
+        self.cur = self.ddl.cur
+        # the next free ID per table in the merged database
+        self.next_ids = {table: 1 for table, _ in ID_COLUMNS}
+        self.timings = {}
+
+    # the shards in the order of their files, each with its next free IDs; a shard must be finished,
+    # and no file may be in more than one shard
+    @staticmethod
+    def order(shards):
+        ordered = []
+        owners = {}
+        for path in shards:
+            con = sqlite3.connect('file:{}?mode=ro'.format(pathname2url(path)), uri=True)
+            build = IncrementalBuild(con)
+            if build.load_checkpoint() is not None:
+                raise ValueError('{} is an unfinished build; resume it before merging'.format(path))
+            files = sorted(build.stored_fingerprints())
+            next_ids = build.next_ids()
+            con.close()
+            for file in files:
+                if file in owners:
+                    raise ValueError('{} is in both {} and {}'.format(file, owners[file], path))
+                owners[file] = path
+            ordered.append((files[0] if files else '', path, next_ids))
+        return [(path, next_ids) for _, path, next_ids in sorted(ordered)]
+
+    def timed(self, step, function):
+        start = perf_counter()
+        function()
+        self.timings[step] = perf_counter() - start
+
+    # copying one shard over, its IDs placed after everything merged so far
+    def merge_shard(self, path, next_ids):
+        offsets = {table: next_id - 1 for table, next_id in self.next_ids.items()}
+        self.cur.execute('ATTACH DATABASE ? AS shard', (path,))
+        for table, columns, select in MERGE_QUERIES:
+            self.cur.execute('INSERT INTO main.{0} ({1}) SELECT {2} FROM shard.{0} ORDER BY rowid'
+                             .format(table, columns, select), offsets)
+        self.con.commit()
+        self.cur.execute('DETACH DATABASE shard')
+        for table in self.next_ids:
+            self.next_ids[table] += next_ids[table] - 1
+
+    def merge(self):
+        self.ddl.begin_bulk_load()
+        start = perf_counter()
+        for number, (path, next_ids) in enumerate(self.shards):
+            print('Merging shard {} of {}: {}'.format(number + 1, len(self.shards), path))
+            self.merge_shard(path, next_ids)
+        self.timings['copy'] = perf_counter() - start
+
+        # incremental builds over the merged database carry on from the shards' high-water marks
+        self.cur.executemany('INSERT OR REPLACE INTO id_counters (table_name, next_id) VALUES (?, ?)',
+                             self.next_ids.items())
+        self.timed('index', self.ddl.create_indexes)
+        self.timed('views', lambda: refresh_views(self.cur))
+        self.timed('search', self.ddl.rebuild_search)
+        violations = self.ddl.end_bulk_load()
+        if violations:
+            print('Warning: {} foreign key violations'.format(violations))
+        self.timed('analyze', self.ddl.analyze)
+        self.ddl.close()
+
+        for step, seconds in self.timings.items():
+            print('{:<10} {:>8.3f} sec'.format(step, seconds))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Merge shard databases from fb2master.py --shard into one.')
+    parser.add_argument('shards', nargs='+', help='shard databases, e.g. fb_shard*_master.db')
+    parser.add_argument('--name', default='fb', help='write NAME_master.db (default: fb_master.db)')
+    args = parser.parse_args()
+
+    ShardMerge(args.shards, args.name).merge()
+    print('\nDone.')
@@ -0,0 +1,118 @@
+# parallel conversion: sentences are sharded by FactBank file across a process pool,
+# then merged back in file order so that every global ID matches a serial run
+
+from itertools import groupby
+from multiprocessing import get_context
+from fb_sentence_processor import FbSentenceProcessor
+from metrics import Metrics
+from fb_records import Sentence, Mention, Source, SourceAncestor, Attitude
+
+# per-worker state, set once by init_worker so that the lookup dictionaries are not re-sent
+# for every file; the spaCy pipeline is loaded lazily, once per worker (see load_model)
+worker_lookups = None
+
+
+def init_worker(lookups):
+    global worker_lookups
+    worker_lookups = lookups
+
+
+# running offset alignment, head spans and nesting levels for a single file, using file-local IDs
+def process_file(args):
+    rows, batch_size, parse_cache = args
+    sp = FbSentenceProcessor(rows, *worker_lookups, batch_size=batch_size,
+                             parse_cache=parse_cache, metrics=Metrics())
+    sp.process_sentences()
+    return (sp.sentences, sp.mentions, sp.sources, sp.source_ancestors, sp.attitudes, sp.errors, sp.num_errors,
+            sp.metrics.snapshot(), sp.last_position)
+
+
+class ShardMerger:
+
+    # with a writer, each merged shard is written out straight away and only the ID counters are kept
+    # first_ids ({table: first ID}) places the merged IDs after an existing database's; checkpoint
+    # is called after every shard the writer takes, as in FbSentenceProcessor.flush
+    def __init__(self, writer=None, metrics=None, first_ids=None, checkpoint=None):
+        self.writer = writer
+        self.checkpoint = checkpoint
+        self.sentences = []
+        self.mentions = []
+        self.sources = []
+        self.source_ancestors = []
+        self.attitudes = []
+        first_ids = first_ids if first_ids is not None else {}
+        self.num_sentences = first_ids.get('sentences', 1) - 1
+        self.num_mentions = first_ids.get('mentions', 1) - 1
+        self.num_sources = first_ids.get('sources', 1) - 1
+        self.num_attitudes = first_ids.get('attitudes', 1) - 1
+        # each worker's timers and counters are folded in here, so the processor timers are
+        # summed CPU-seconds rather than wall-clock time
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.errors = []
+        self.num_errors = 0
+
+    # shifting a shard's file-local IDs past everything merged so far; shards must arrive in file order
+    def merge(self, shard):
+        sentences, mentions, sources, source_ancestors, attitudes, errors, num_errors, snapshot, position = shard
+        sentence_offset = self.num_sentences
+        mention_offset = self.num_mentions
+        source_offset = self.num_sources
+        attitude_offset = self.num_attitudes
+
+        shard_sentences = [Sentence(sentence.sentence_id + sentence_offset, *sentence[1:]) for sentence in sentences]
+        shard_mentions = [Mention(mention.token_id + mention_offset, mention.sentence_id + sentence_offset,
+                                  *mention[2:]) for mention in mentions]
+
+        shard_sources = []
+        for source in sources:
+            parent_source_id = source.parent_source_id
+            if parent_source_id not in (None, -1):
+                parent_source_id += source_offset
+            shard_sources.append(Source(source.source_id + source_offset, source.sentence_id + sentence_offset,
+                                        source.token_id + mention_offset, parent_source_id, *source[4:]))
+
+        shard_ancestors = [SourceAncestor(source_id + source_offset, ancestor_id + source_offset, depth)
+                           for source_id, ancestor_id, depth in source_ancestors]
+        shard_attitudes = [Attitude(attitude.attitude_id + attitude_offset, attitude.source_id + source_offset,
+                                    attitude.target_token_id + mention_offset, *attitude[3:])
+                           for attitude in attitudes]
+
+        self.num_sentences += len(sentences)
+        self.num_mentions += len(mentions)
+        self.num_sources += len(sources)
+        self.num_attitudes += len(attitudes)
+        self.num_errors += num_errors
+        self.metrics.merge(snapshot)
+
+        if self.writer is not None:
+            self.writer(shard_sentences, shard_mentions, shard_sources, shard_ancestors, shard_attitudes, errors)
+            if self.checkpoint is not None and position is not None:
+                self.checkpoint(position, self.next_ids())
+        else:
+            self.errors.extend(errors)
+            self.sentences.extend(shard_sentences)
+            self.mentions.extend(shard_mentions)
+            self.sources.extend(shard_sources)
+            self.source_ancestors.extend(shard_ancestors)
+            self.attitudes.extend(shard_attitudes)
+
+
+    def next_ids(self):
+        return {'sentences': self.num_sentences + 1, 'mentions': self.num_mentions + 1,
+                'sources': self.num_sources + 1, 'attitudes': self.num_attitudes + 1}
+
+
+# splitting the (file, sentid)-ordered sentence set by file and farming each file out to the pool
+def process_parallel(sentences_set, lookups, workers, batch_size=256, parse_cache=None, writer=None,
+                     metrics=None, first_ids=None, checkpoint=None):
+    files = [list(rows) for _, rows in groupby(sentences_set, key=lambda row: row[FbSentenceProcessor.FILE])]
+
+    merger = ShardMerger(writer, metrics, first_ids, checkpoint)
+    bar = merger.metrics.progress('Files Processed', len(files))
+    # fork lets workers inherit the lookup dictionaries instead of pickling them
+    with get_context('fork').Pool(workers, initializer=init_worker, initargs=(lookups,)) as pool:
+        for shard in pool.imap(process_file, [(rows, batch_size, parse_cache) for rows in files]):
+            merger.merge(shard)
+            bar.next()
+    bar.finish()
+    return merger
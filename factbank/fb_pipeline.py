@@ -0,0 +1,291 @@
+# pipelined conversion: a reader thread streams sentences out of FactBank, a parse stage (a thread,
+# optionally fanning out to a process pool) runs spaCy over them, the calling thread aligns and
+# catalogues them and a writer thread writes every flush to the master database; the stages are
+# joined by bounded queues, so reading, parsing and writing overlap without any stage running away
+# from the others; the calling thread owns the ID counters and takes sentences in input order, so
+# the output is identical to a serial run's
+#
+# every stage records how long it was busy, how long it waited on its input queue (starved) and on
+# its output queue (blocked), and every queue samples its depth on each put; a stage that is never
+# starved while the others are is the bottleneck. The threads share one Metrics, each writing only
+# its own names
+
+from collections import deque
+from itertools import islice
+from multiprocessing import get_context
+from queue import Queue, Empty, Full
+from threading import Thread, Event
+from time import perf_counter
+from spacy.tokens import Doc
+from spacy.vocab import Vocab
+from fb_sentence_processor import FbSentenceProcessor, load_model, get_model_id
+from parse_cache import ParseCache
+
+# the end of a stream, passed down every queue
+DONE = object()
+
+# how often a blocked stage checks whether another stage has failed, in seconds
+POLL_INTERVAL = 0.1
+
+STAGES = ['reader', 'parse', 'align', 'writer']
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+# a bounded queue between two stages; put and get give up once the pipeline has been aborted
+class StageQueue:
+
+    def __init__(self, name, capacity, metrics, aborted):
+        self.name = name
+        self.capacity = capacity
+        self.queue = Queue(capacity)
+        self.metrics = metrics
+        self.aborted = aborted
+
+    def put(self, item):
+        start = perf_counter()
+        while True:
+            try:
+                self.queue.put(item, timeout=POLL_INTERVAL)
+                break
+            except Full:
+                if self.aborted.is_set():
+                    raise PipelineAborted()
+        self.metrics.add_time('pipeline.{}.put_wait'.format(self.name), perf_counter() - start)
+        depth = self.queue.qsize()
+        self.metrics.gauge('pipeline.{}.depth'.format(self.name), depth)
+        self.metrics.count('pipeline.{}.depth_total'.format(self.name), depth)
+        self.metrics.count('pipeline.{}.puts'.format(self.name))
+
+    def get(self):
+        start = perf_counter()
+        while True:
+            try:
+                item = self.queue.get(timeout=POLL_INTERVAL)
+                break
+            except Empty:
+                if self.aborted.is_set():
+                    raise PipelineAborted()
+        self.metrics.add_time('pipeline.{}.get_wait'.format(self.name), perf_counter() - start)
+        return item
+
+    # every item up to the end of the stream
+    def __iter__(self):
+        while True:
+            item = self.get()
+            if item is DONE:
+                return
+            yield item
+
+
+# parsing a batch of cleaned sentences inside a pool worker; Docs go back serialised, as in the parse cache
+def parse_texts(texts, batch_size):
+    return [doc.to_bytes(exclude=ParseCache.EXCLUDE) for doc in load_model().pipe(texts, batch_size=batch_size)]
+
+
+class Pipeline:
+
+    # sentences_set and lookups are as for FbSentenceProcessor; sentences_set is read from the reader
+    # thread, and writer and checkpoint are called from the writer thread, so they must not share a
+    # connection; parse_workers > 0 parses in a process pool; queue_size is the capacity of each
+    # queue, in batches of batch_size sentences
+    def __init__(self, sentences_set, lookups, writer, batch_size=256, parse_cache=None, parse_workers=0,
+                 queue_size=4, flush_size=1000, metrics=None, num_sentences=0, first_ids=None,
+                 checkpoint=None):
+        self.sentences_set = sentences_set
+        self.writer = writer
+        self.checkpoint = checkpoint
+        self.batch_size = max(batch_size, 1)
+        self.parse_cache = parse_cache
+        self.parse_workers = parse_workers
+        self.aborted = Event()
+        self.failures = []
+
+        # the aligning stage is an ordinary processor, whose flushes are queued for the writer
+        self.processor = FbSentenceProcessor(None, *lookups, batch_size=self.batch_size, flush_size=flush_size,
+                                             writer=self.queue_rows, metrics=metrics,
+                                             num_sentences=num_sentences, first_ids=first_ids,
+                                             checkpoint=self.queue_checkpoint if checkpoint is not None else None)
+        self.metrics = self.processor.metrics
+
+        self.read_queue = StageQueue('read', queue_size, self.metrics, self.aborted)
+        self.parse_queue = StageQueue('parse', queue_size, self.metrics, self.aborted)
+        self.write_queue = StageQueue('write', queue_size, self.metrics, self.aborted)
+
+    def queue_rows(self, *rows):
+        self.write_queue.put(('rows', rows))
+
+    def queue_checkpoint(self, position, next_ids):
+        self.write_queue.put(('checkpoint', (position, next_ids)))
+
+    # running a stage's body in a thread, handing DONE downstream once it finishes; a failure
+    # aborts every other stage
+    def stage_thread(self, name, body, output=None):
+        def run():
+            start = perf_counter()
+            try:
+                body()
+                if output is not None:
+                    output.put(DONE)
+            except PipelineAborted:
+                pass
+            except BaseException as error:
+                self.failures.append(error)
+                self.aborted.set()
+            finally:
+                self.metrics.add_time('pipeline.{}.elapsed'.format(name), perf_counter() - start)
+
+        return Thread(target=run, name='fb-' + name, daemon=True)
+
+    def read(self):
+        rows = iter(self.sentences_set)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return
+            self.read_queue.put(batch)
+
+    # every row the reader passes on
+    def queued_rows(self):
+        for batch in self.read_queue:
+            yield from batch
+
+    # a processor that only cleans and parses, created in the parse thread so that its parse cache
+    # connection belongs to that thread
+    def parser(self, parse_cache=None):
+        return FbSentenceProcessor(self.queued_rows(), None, None, None, None, batch_size=self.batch_size,
+                                   parse_cache=parse_cache)
+
+    # parsing in this thread, pulling rows from the reader lazily, batch_size at a time
+    def parse_in_thread(self):
+        parser = self.parser(self.parse_cache)
+        parsed = parser.parse_sentences()
+        while True:
+            batch = list(islice(parsed, self.batch_size))
+            if not batch:
+                break
+            self.parse_queue.put(batch)
+        self.count_cache(parser.parse_cache)
+
+    # parsing in the pool, with up to two batches per worker in flight; batches are handed on in
+    # the order they were read
+    def parse_in_pool(self, pool):
+        cache = ParseCache(self.parse_cache, get_model_id()) if self.parse_cache is not None else None
+        vocab = cache.vocab if cache is not None else Vocab()
+        pending = deque()
+        rows = self.parser().clean_sentences()
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if batch:
+                texts = [row[FbSentenceProcessor.SENTENCE] for row in batch]
+                docs = cache.get_many(texts) if cache is not None else {}
+                missing = list(dict.fromkeys(text for text in texts if text not in docs))
+                result = pool.apply_async(parse_texts, (missing, self.batch_size)) if missing else None
+                pending.append((batch, docs, missing, result))
+            while pending and (not batch or len(pending) > 2 * self.parse_workers):
+                batch_rows, docs, missing, result = pending.popleft()
+                if result is not None:
+                    parsed = [Doc(vocab).from_bytes(doc_bytes, exclude=ParseCache.EXCLUDE)
+                              for doc_bytes in result.get()]
+                    if cache is not None:
+                        cache.put_many(parsed)
+                    docs.update(zip(missing, parsed))
+                self.parse_queue.put([(row, docs[row[FbSentenceProcessor.SENTENCE]]) for row in batch_rows])
+            if not batch:
+                break
+        self.count_cache(cache)
+
+    def count_cache(self, cache):
+        if cache is not None:
+            self.metrics.count('parse_cache.hits', cache.hits)
+            self.metrics.count('parse_cache.misses', cache.misses)
+            print('Parse cache: {} hits, {} misses'.format(cache.hits, cache.misses))
+            cache.close()
+
+    def write(self):
+        for kind, args in self.write_queue:
+            if kind == 'rows':
+                self.writer(*args)
+            else:
+                self.checkpoint(*args)
+
+    # aligning and cataloguing in the calling thread, in input order
+    def align(self):
+        processor = self.processor
+        progress = self.metrics.progress('Sentences Processed', processor.num_sentences)
+        for batch in self.parse_queue:
+            for row, doc in batch:
+                start = perf_counter()
+                processor.process_parsed_sentence(row, doc)
+                self.metrics.add_time('stage.align', perf_counter() - start)
+                processor.sentence_done(progress)
+        progress.finish()
+        print('\nSentence processing complete.')
+        processor.flush()
+
+    def run(self):
+        # the pool is forked before any of the threads start
+        pool = get_context('fork').Pool(self.parse_workers) if self.parse_workers > 0 else None
+        parse = (lambda: self.parse_in_pool(pool)) if pool is not None else self.parse_in_thread
+        threads = [self.stage_thread('reader', self.read, self.read_queue),
+                   self.stage_thread('parse', parse, self.parse_queue),
+                   self.stage_thread('writer', self.write)]
+        for thread in threads:
+            thread.start()
+
+        start = perf_counter()
+        try:
+            self.align()
+            self.write_queue.put(DONE)
+        except PipelineAborted:
+            pass
+        except BaseException:
+            self.aborted.set()
+            raise
+        finally:
+            self.metrics.add_time('pipeline.align.elapsed', perf_counter() - start)
+            for thread in threads:
+                thread.join()
+            if pool is not None:
+                pool.terminate() if self.aborted.is_set() else pool.close()
+                pool.join()
+
+        if self.failures:
+            raise self.failures[0]
+        self.metrics.add_time('stage.parse', self.busy('parse'))
+        self.report()
+        return self.processor
+
+    # a stage's time spent neither starved nor blocked
+    def busy(self, stage):
+        waits = {'reader': ['read.put_wait'], 'parse': ['read.get_wait', 'parse.put_wait'],
+                 'align': ['parse.get_wait', 'write.put_wait'], 'writer': ['write.get_wait']}[stage]
+        return self.metrics.seconds('pipeline.{}.elapsed'.format(stage)) - \
+            sum(self.metrics.seconds('pipeline.' + wait) for wait in waits)
+
+    def report(self):
+        starved = {'reader': None, 'parse': 'read.get_wait', 'align': 'parse.get_wait', 'writer': 'write.get_wait'}
+        blocked = {'reader': 'read.put_wait', 'parse': 'parse.put_wait', 'align': 'write.put_wait', 'writer': None}
+        lines = ['', '{:<10} {:>10} {:>10} {:>10}'.format('stage', 'busy (s)', 'starved', 'blocked')]
+        for stage in STAGES:
+            waits = [self.metrics.seconds('pipeline.' + wait) if wait is not None else 0.0
+                     for wait in (starved[stage], blocked[stage])]
+            lines.append('{:<10} {:>10.3f} {:>10.3f} {:>10.3f}'.format(stage, self.busy(stage), *waits))
+
+        lines.append('')
+        lines.append('{:<10} {:>10} {:>10} {:>10}'.format('queue', 'capacity', 'mean', 'max'))
+        for stage_queue in [self.read_queue, self.parse_queue, self.write_queue]:
+            puts = self.metrics.counters.get('pipeline.{}.puts'.format(stage_queue.name), 0)
+            total = self.metrics.counters.get('pipeline.{}.depth_total'.format(stage_queue.name), 0)
+            peak = self.metrics.gauges.get('pipeline.{}.depth'.format(stage_queue.name), [0, 0])[1]
+            mean = total / puts if puts else 0.0
+            lines.append('{:<10} {:>10} {:>10.2f} {:>10}'.format(stage_queue.name, stage_queue.capacity, mean, peak))
+            self.metrics.emit('queue', queue=stage_queue.name, capacity=stage_queue.capacity,
+                              mean_depth=round(mean, 2), max_depth=peak)
+        print('\n'.join(lines))
+
+
+def process_pipelined(sentences_set, lookups, writer, **options):
+    return Pipeline(sentences_set, lookups, writer, **options).run()
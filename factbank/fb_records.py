@@ -0,0 +1,21 @@
+# row types for the master schema, one field per persisted column in the order of the INSERTs in
+# fb2master.py (errors.result_sentence is computed by SQLite, see ddl.py); namedtuples are plain
+# tuples underneath (no per-row __dict__), so lists of them go straight to executemany and pickle
+# compactly between processes
+
+from collections import namedtuple
+
+Sentence = namedtuple('Sentence', ['sentence_id', 'file', 'file_sentence_id', 'sentence'])
+
+Mention = namedtuple('Mention', ['token_id', 'sentence_id', 'token_text', 'token_offset_start', 'token_offset_end',
+                                 'phrase_text', 'phrase_offset_start', 'phrase_offset_end'])
+
+Source = namedtuple('Source', ['source_id', 'sentence_id', 'token_id', 'parent_source_id', 'nesting_level',
+                               'source'])
+
+SourceAncestor = namedtuple('SourceAncestor', ['source_id', 'ancestor_source_id', 'depth'])
+
+Attitude = namedtuple('Attitude', ['attitude_id', 'source_id', 'target_token_id', 'label', 'label_type'])
+
+Error = namedtuple('Error', ['file', 'file_sentence_id', 'offset_start', 'offset_end', 'predicted_head', 'head',
+                             'raw_sentence', 'rel_source_text'])
@@ -0,0 +1,112 @@
+# lookups over a finished fb_master.db through its full-text tables (sentence_search, mention_search)
+# and the interval index on mention offsets (see ddl.py), e.g. for triaging the misaligned heads in
+# the errors table without LIKE scans
+
+import argparse
+import sqlite3
+
+
+# an FTS5 string literal, so that text is matched as a phrase rather than parsed as a query
+def fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+class FbSearch:
+
+    def __init__(self, master='fb_master.db'):
+        self.con = sqlite3.connect(master)
+        self.con.row_factory = sqlite3.Row
+
+    # sentences matching an FTS5 query (e.g. 'bank AND john', or 'fall*'), best matches first
+    def sentences_matching(self, query, limit=None):
+        return self.con.execute('SELECT s.* FROM sentence_search '
+                                'JOIN sentences s ON s.sentence_id = sentence_search.rowid '
+                                'WHERE sentence_search MATCH ? ORDER BY rank LIMIT ?',
+                                (query, -1 if limit is None else limit)).fetchall()
+
+    # mentions whose head (or, with phrase=True, head or phrase) matches an FTS5 query
+    def mentions_matching(self, query, phrase=False, limit=None):
+        if not phrase:
+            query = 'token_text : ({})'.format(query)
+        return self.con.execute('SELECT m.* FROM mention_search '
+                                'JOIN mentions m ON m.token_id = mention_search.rowid '
+                                'WHERE mention_search MATCH ? ORDER BY rank LIMIT ?',
+                                (query, -1 if limit is None else limit)).fetchall()
+
+    # sentences with a mention whose head is the given text (matched as a phrase, case-insensitively)
+    def sentences_with_head(self, head, limit=None):
+        return self.con.execute('SELECT * FROM sentences WHERE sentence_id IN ('
+                                'SELECT m.sentence_id FROM mention_search '
+                                'JOIN mentions m ON m.token_id = mention_search.rowid '
+                                'WHERE mention_search MATCH ?) ORDER BY sentence_id LIMIT ?',
+                                ('token_text : ' + fts_phrase(head), -1 if limit is None else limit)).fetchall()
+
+    def sentence(self, file, file_sentence_id):
+        return self.con.execute('SELECT * FROM sentences WHERE file = ? AND file_sentence_id = ?',
+                                (file, file_sentence_id)).fetchone()
+
+    # mentions of a sentence whose head overlaps the half-open offset range [start, end), in offset
+    # order; mentions with no head (offset -1) never overlap
+    def overlapping_mentions(self, sentence_id, start, end):
+        return self.con.execute('SELECT * FROM mentions WHERE sentence_id = ? '
+                                'AND token_offset_start < ? AND token_offset_end > ? AND token_offset_start != -1 '
+                                'ORDER BY token_offset_start, token_offset_end',
+                                (sentence_id, end, start)).fetchall()
+
+    # everything needed to triage one row of the errors table: the error, its sentence, the mentions
+    # overlapping the offsets the aligner predicted, and the mentions of that sentence carrying the
+    # expected head text
+    def error_context(self, error_id):
+        error = self.con.execute('SELECT * FROM errors WHERE error_id = ?', (error_id,)).fetchone()
+        if error is None:
+            raise ValueError('no error {}'.format(error_id))
+        sentence = self.sentence(error['file'], error['file_sentence_id'])
+        if sentence is None:
+            return error, None, [], []
+        overlapping = self.overlapping_mentions(sentence['sentence_id'], error['offset_start'], error['offset_end'])
+        heads = self.con.execute('SELECT m.* FROM mention_search '
+                                 'JOIN mentions m ON m.token_id = mention_search.rowid '
+                                 'WHERE mention_search MATCH ? AND m.sentence_id = ? ORDER BY m.token_offset_start',
+                                 ('token_text : ' + fts_phrase(error['head']), sentence['sentence_id'])).fetchall()
+        return error, sentence, overlapping, heads
+
+    def close(self):
+        self.con.close()
+
+
+def print_rows(rows):
+    for row in rows:
+        print('\t'.join(str(value) for value in row))
+    print('({} rows)'.format(len(rows)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Search the sentences and mentions of fb_master.db.')
+    parser.add_argument('--master', default='fb_master.db')
+    parser.add_argument('--sentences', metavar='QUERY', help='sentences matching an FTS5 query')
+    parser.add_argument('--mentions', metavar='QUERY', help='mentions whose head or phrase matches an FTS5 query')
+    parser.add_argument('--head', help='sentences with a mention whose head is HEAD')
+    parser.add_argument('--overlap', nargs=3, type=int, metavar=('SENTENCE_ID', 'START', 'END'),
+                        help='mentions of a sentence overlapping the offsets [START, END)')
+    parser.add_argument('--error', type=int, metavar='ERROR_ID', help='triage one row of the errors table')
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    search = FbSearch(args.master)
+    if args.sentences:
+        print_rows(search.sentences_matching(args.sentences, args.limit))
+    if args.mentions:
+        print_rows(search.mentions_matching(args.mentions, phrase=True, limit=args.limit))
+    if args.head:
+        print_rows(search.sentences_with_head(args.head, args.limit))
+    if args.overlap:
+        print_rows(search.overlapping_mentions(*args.overlap))
+    if args.error is not None:
+        error, sentence, overlapping, heads = search.error_context(args.error)
+        print_rows([error])
+        print('sentence:', None if sentence is None else sentence['sentence'])
+        print('mentions overlapping the predicted head:')
+        print_rows(overlapping)
+        print('mentions headed by {!r}:'.format(error['head']))
+        print_rows(heads)
+    search.close()
@@ -1,5 +1,28 @@
-from progress.bar import Bar
+from functools import lru_cache
+from itertools import islice
+from time import perf_counter
 import spacy
+from parse_cache import ParseCache
+from head_aligner import HeadAligner
+from span_resolver import SpanResolver
+from fb_records import Sentence, Mention, Source, SourceAncestor, Attitude, Error
+from metrics import Metrics
+
+MODEL = "en_core_web_sm"
+# get_head_span only reads dep_, pos_, ancestors and left/right edges, which come from the
+# tagger, attribute ruler and parser; named entities and lemmas are never used
+EXCLUDED_COMPONENTS = ['ner', 'lemmatizer']
+
+
+# loading the trimmed pipeline at most once per process
+@lru_cache(maxsize=None)
+def load_model():
+    return spacy.load(MODEL, exclude=EXCLUDED_COMPONENTS)
+
+
+# e.g. 'en_core_web_sm==3.7.1', read from the installed package so the model itself needn't be loaded
+def get_model_id():
+    return '{}=={}'.format(MODEL, spacy.util.get_package_version(MODEL))
 
 
 class FbSentenceProcessor:
@@ -10,84 +33,240 @@ class FbSentenceProcessor:
     RAW_OFFSET_INIT = 2
     REL_SOURCE_TEXT = 2
 
-    def __init__(self, sentences_set, initial_offsets, rel_source_texts,
-                 source_offsets, target_offsets, targets, fact_values):
+    def __init__(self, sentences_set, rel_source_texts, source_offsets, targets, fact_values,
+                 batch_size=256, nlp=None, parse_cache=None, flush_size=0, writer=None,
+                 metrics=None, num_sentences=0, first_ids=None, checkpoint=None):
 
-        # loading data from outside object's SQL queries
+        # loading data from outside object's SQL queries; every lookup has its quotes stripped and
+        # its offsets rebased to the sentence already, and only needs to support get() and []
         self.sentences_set = sentences_set
-        self.initial_offsets = initial_offsets
         self.source_offsets = source_offsets
-        self.errors = {}
+        # failed alignments, as Error rows in the order they occur
+        self.errors = []
         self.num_errors = 0
         self.rel_source_texts = rel_source_texts
-        self.target_offsets = target_offsets
         self.fact_values = fact_values
         self.targets = targets
 
-        # python representation of database for data pre-processing
+        # python representation of database for data pre-processing; IDs start from first_ids
+        # ({table: first ID}) when adding to an existing database, see fb_incremental.py
+        first_ids = first_ids if first_ids is not None else {}
         self.sentences = []
-        self.next_sentence_id = 1
+        self.next_sentence_id = first_ids.get('sentences', 1)
 
         self.mentions = []
         self.unique_mentions = {}
-        self.next_mention_id = 1
+        self.next_mention_id = first_ids.get('mentions', 1)
 
         self.sources = []
-        self.next_source_id = 1
-
-        self.attitudes = {}
-        self.next_attitude_id = 1
-
-        self.nlp = spacy.load("en_core_web_sm")
+        self.next_source_id = first_ids.get('sources', 1)
+        # (global_sentence_id, nesting_level, relevant_source_id) -> source_id, for parent lookups
+        self.source_index = {}
+
+        # closure of the source hierarchy: a (source_id, ancestor_source_id, depth) row for every source
+        # and each of its ancestors, itself included at depth 0
+        self.source_ancestors = []
+        self.ancestor_index = {}
+
+        self.attitudes = []
+        self.next_attitude_id = first_ids.get('attitudes', 1)
+
+        # streaming mode: every flush_size sentences, finished rows are handed to
+        # writer(sentences, mentions, sources, source_ancestors, attitudes, errors) and dropped;
+        # 0 keeps everything in memory
+        self.flush_size = flush_size
+        self.writer = writer
+        self.sentences_since_flush = 0
+        # after each flush, checkpoint((file, sentence id) of the last sentence written, next_ids())
+        # records how far the conversion got, see --resume in fb2master.py
+        self.checkpoint = checkpoint
+        self.last_position = None
+
+        # timers and counters for parsing, aligning and the hot functions below; num_sentences sizes
+        # the progress report, and is counted by the caller since sentences_set may be a cursor
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.num_sentences = num_sentences
+
+        # number of sentences handed to spaCy at once; 0 falls back to parsing one sentence at a time
+        self.batch_size = batch_size
+        # the pipeline is loaded on first use (see the nlp property); an already-loaded
+        # pipeline can also be passed in
+        self.loaded_nlp = nlp
+
+        # optional on-disk cache of parses, given as a path; only used by the batched path
+        self.parse_cache = None
+        if parse_cache is not None:
+            model_id = get_model_id() if nlp is None else ParseCache.get_model_id(nlp)
+            self.parse_cache = ParseCache(parse_cache, model_id)
         self.current_doc = None
+        self.current_resolver = None
         self.current_sentence = None
+        self.current_aligner = None
         self.current_head = None
 
+    @property
+    def nlp(self):
+        if self.loaded_nlp is None:
+            self.loaded_nlp = load_model()
+        return self.loaded_nlp
+
     # sending each sentence to the process_sentence function
     def go(self):
-        bar = Bar('Examples Processed', max=13506)  # 13506 = number of attitudes
-        for row in self.sentences_set:
-            row = list(row)
-            self.process_sentence(row, bar)
+        progress = self.metrics.progress('Sentences Processed', self.num_sentences)
+        self.process_sentences(progress)
         print('\nSentence processing complete.')
+        progress.finish()
+        if self.parse_cache is not None:
+            print('Parse cache: {} hits, {} misses'.format(self.parse_cache.hits, self.parse_cache.misses))
+
+        if self.writer is not None:
+            self.flush()
+
+    # progress is ticked once per (non-header) sentence, and may be None inside a worker process
+    def process_sentences(self, progress=None):
+        if self.batch_size:
+            for row, doc in self.timed(self.parse_sentences(), 'stage.parse'):
+                self.timed_call(self.process_parsed_sentence, row, doc)
+                self.sentence_done(progress)
+        else:
+            for row in self.sentences_set:
+                if row[self.SENTENCE_ID] == 0:
+                    continue
+                row = list(row)
+                self.timed_call(self.process_sentence, row)
+                self.sentence_done(progress)
+
+        if self.parse_cache is not None:
+            self.metrics.count('parse_cache.hits', self.parse_cache.hits)
+            self.metrics.count('parse_cache.misses', self.parse_cache.misses)
+            self.parse_cache.close()
+
+    # charging the time spent waiting on each item of a generator to a timer
+    def timed(self, iterable, timer):
+        iterator = iter(iterable)
+        while True:
+            start = perf_counter()
+            item = next(iterator, None)
+            self.metrics.add_time(timer, perf_counter() - start)
+            if item is None:
+                return
+            yield item
+
+    # charging a sentence to the align stage, less any parsing it triggered (see get_head_span)
+    def timed_call(self, function, *args):
+        start = perf_counter()
+        parse_before = self.metrics.seconds('stage.parse')
+        function(*args)
+        self.metrics.add_time('stage.align',
+                              perf_counter() - start - (self.metrics.seconds('stage.parse') - parse_before))
+
+    def sentence_done(self, progress=None):
+        if progress is not None:
+            progress.next()
+        self.sentences_since_flush += 1
+        if self.writer is not None and self.sentences_since_flush >= self.flush_size:
+            self.flush()
+
+    # writing out every finished sentence and its errors, keeping only the ID counters; all the
+    # per-sentence indexes (unique mentions, sources, ancestors) can go, since nothing links sentences,
+    # so the counters are the whole state a resumed run needs
+    def flush(self):
+        self.writer(self.sentences, self.mentions, self.sources, self.source_ancestors, self.attitudes,
+                    self.errors)
+        if self.checkpoint is not None and self.last_position is not None:
+            self.checkpoint(self.last_position, self.next_ids())
 
-        # removing internal data before SQL insertion
-        for i in range(len(self.sources)):
-            self.sources[i] = self.sources[i][:-1]
-        bar.finish()
-
-        self.uu_to_rob()
+        self.sentences = []
+        self.mentions = []
+        self.unique_mentions = {}
+        self.sources = []
+        self.source_index = {}
+        self.source_ancestors = []
+        self.ancestor_index = {}
+        self.attitudes = []
+        self.errors = []
+        self.sentences_since_flush = 0
+
+    # the next ID per table, as first_ids takes them
+    def next_ids(self):
+        return {'sentences': self.next_sentence_id, 'mentions': self.next_mention_id,
+                'sources': self.next_source_id, 'attitudes': self.next_attitude_id}
 
     def get_errors(self):
         return self.errors, self.num_errors
 
+    # stripping FactBank's quoting and escaping from a raw sentence
+    @staticmethod
+    def clean_sentence(raw_sentence):
+        sentence = str(raw_sentence[1:-2].replace("\\", ""))
+        sentence = sentence.replace("``", '"')
+        sentence = sentence.replace("''", "\"")
+        return sentence
+
+    # cleaning every sentence up front so that spaCy can parse them in batches
+    def clean_sentences(self):
+        for row in self.sentences_set:
+            if row[self.SENTENCE_ID] == 0:
+                continue
+            row = list(row)
+            row[self.SENTENCE] = self.clean_sentence(row[self.SENTENCE])
+            yield row
+
+    # streaming the cleaned sentences through nlp.pipe, pairing each row with its finished Doc;
+    # rows come back in their original order, so global IDs match the one-at-a-time path
+    def parse_sentences(self):
+        if self.parse_cache is None:
+            texts = ((row[self.SENTENCE], row) for row in self.clean_sentences())
+            for doc, row in self.nlp.pipe(texts, as_tuples=True, batch_size=self.batch_size):
+                yield row, doc
+            return
+
+        # with a cache, each batch is split into cached Docs and ones that still need parsing
+        rows = self.clean_sentences()
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            docs = self.parse_cache.get_many([row[self.SENTENCE] for row in batch])
+            missing = list(dict.fromkeys(row[self.SENTENCE] for row in batch if row[self.SENTENCE] not in docs))
+            if missing:
+                parsed = list(self.nlp.pipe(missing, batch_size=self.batch_size))
+                self.parse_cache.put_many(parsed)
+                docs.update(zip(missing, parsed))
+            for row in batch:
+                yield row, docs[row[self.SENTENCE]]
+
     # dealing with a single sentence -- go nesting level by nesting level,
     # dealing with each top-level source as it appears in FactBank
-    def process_sentence(self, row, bar):
+    def process_sentence(self, row):
         if row[self.SENTENCE_ID] == 0:
             return
 
-        row[self.SENTENCE] = str(row[self.SENTENCE][1:-2].replace("\\", ""))
-        row[self.SENTENCE] = row[self.SENTENCE].replace("``", '"')
-        row[self.SENTENCE] = row[self.SENTENCE].replace("''", "\"")
+        row[self.SENTENCE] = self.clean_sentence(row[self.SENTENCE])
+        self.process_parsed_sentence(row, None)
+
+    # same as above, for a sentence that has already been cleaned; if it hasn't been parsed yet,
+    # doc is None and parsing waits until the first head span is needed
+    def process_parsed_sentence(self, row, doc):
         self.current_sentence = row[self.SENTENCE]
+        self.last_position = (row[self.FILE], row[self.SENTENCE_ID])
 
         self.sentences.append(
-            (self.next_sentence_id, row[self.FILE][1:-1], row[self.SENTENCE_ID], self.current_sentence))
+            Sentence(self.next_sentence_id, row[self.FILE][1:-1], row[self.SENTENCE_ID], self.current_sentence))
         global_sentence_id = self.next_sentence_id
         self.next_sentence_id += 1
 
-        self.current_doc = self.nlp(self.current_sentence)
+        self.current_doc = doc
+        self.current_resolver = None
+        self.current_aligner = HeadAligner(self.current_sentence)
 
-        self.traverse_nesting_structure(row, global_sentence_id, bar)
+        self.traverse_nesting_structure(row, global_sentence_id)
 
-    def traverse_nesting_structure(self, row, global_sentence_id, bar):
+    def traverse_nesting_structure(self, row, global_sentence_id):
         # grabbing the relevant top-level source from the dictionary created earlier
         # and filling in values for author-only annotations
         rel_source_key = (row[self.FILE], row[self.SENTENCE_ID])
-        if rel_source_key not in self.rel_source_texts:
-            self.rel_source_texts[rel_source_key] = [(-1, 'AUTHOR')]
-        sources = self.rel_source_texts[rel_source_key]
+        sources = self.rel_source_texts.get(rel_source_key, [(-1, 'AUTHOR')])
 
         # dealing with each relevant source starting at the lowest nesting level, i.e., AUTHOR
         # here, rel_source_id represents the sentence-level ID for that source,
@@ -114,45 +293,32 @@ class FbSentenceProcessor:
                                                            current_nesting_level, rel_source_id)
 
                 # now we actually insert the source
-                self.sources.append((self.next_source_id, global_sentence_id, global_source_token_id,
-                                     parent_source_id, current_nesting_level, relevant_source, relevant_source_id))
+                attitude_source_id = self.add_source(global_sentence_id, global_source_token_id, parent_source_id,
+                                                     current_nesting_level, relevant_source, relevant_source_id)
 
                 # dealing with targets now
-                attitude_source_id = self.next_source_id
-                self.next_source_id += 1
 
                 # retrieving all attitudes linked to the source we just inserted, if there are any
-                eid_label_key = (row[self.FILE], row[self.SENTENCE_ID],
-                                 "'{}'".format(rel_source_id))
+                eid_label_key = (row[self.FILE], row[self.SENTENCE_ID], rel_source_id)
 
-                if eid_label_key not in self.fact_values:
+                eid_label_return = self.fact_values.get(eid_label_key)
+                if eid_label_return is None:
                     continue
-                else:
-                    eid_label_return = self.fact_values[eid_label_key]
 
                 self.parse_attitudes(eid_label_return, row, rel_source_text,
-                                     global_sentence_id, attitude_source_id, bar)
+                                     global_sentence_id, attitude_source_id)
 
-    def parse_attitudes(self, eid_label_return, row, rel_source_text, global_sentence_id, attitude_source_id, bar):
+    def parse_attitudes(self, eid_label_return, row, rel_source_text, global_sentence_id, attitude_source_id):
         # iterating over each attitude, inserting to the attitudes table
         for example in eid_label_return:
 
             eid = example[0]
-            fact_value = example[1][1:-2]
+            fact_value = example[1]
 
-            target_return = self.targets[(row[self.FILE], row[self.SENTENCE_ID], eid)]
+            # targets come joined to their (sentence-based) offsets, which FactBank keys by tokLoc
+            target_head, target_offset_start, target_offset_end = \
+                self.targets[(row[self.FILE], row[self.SENTENCE_ID], eid)]
 
-            # we need the tokLoc in order to get at the target offsets
-            # (this is an artifact of the original FactBank data)
-            tok_loc = target_return[0]
-            target_head = target_return[1][1:-1]
-            target_offsets_return = self.target_offsets[(row[self.FILE], row[self.SENTENCE_ID],
-                                                         tok_loc)]
-
-            target_offset_start = target_offsets_return[0]
-            target_offset_end = target_offsets_return[1]
-
-            target_head = target_head.replace("\\", "")
             target_offset_start, target_offset_end, success = self.calc_offsets(row[self.FILE],
                                                                                 row[self.SENTENCE_ID],
                                                                                 row[self.SENTENCE],
@@ -163,36 +329,24 @@ class FbSentenceProcessor:
             if success:
                 self.catalog_attitude(global_sentence_id, target_head, target_offset_start,
                                       target_offset_end, attitude_source_id, fact_value)
-            bar.next()
 
     def get_head_span(self, head_token_offset_start, head_token_offset_end):
-
+        if self.current_doc is None:
+            start = perf_counter()
+            self.current_doc = self.nlp(self.current_sentence)
+            self.metrics.add_time('stage.parse', perf_counter() - start)
+
+        # latency of the span lookup itself; any parse above is charged to the parse stage
+        start = perf_counter()
+        if self.current_resolver is None:
+            self.current_resolver = SpanResolver(self.current_doc)
+
+        # the syntactic head is the FactBank head itself if it is the root, otherwise its nearest
+        # noun, verb or pronoun ancestor (or, failing that, number); see SpanResolver
         fb_head_token = self.current_doc.char_span(head_token_offset_start, head_token_offset_end,
                                                    alignment_mode='expand')[0]
-
-        if fb_head_token.dep_ == 'ROOT':
-            syntactic_head_token = fb_head_token
-        else:
-            syntactic_head_token = None
-            ancestors = list(fb_head_token.ancestors)
-            ancestors.insert(0, fb_head_token)
-
-            if len(ancestors) == 1:
-                syntactic_head_token = ancestors[0]
-            else:
-                for token in ancestors:
-                    if token.pos_ in ['PRON', 'PROPN', 'NOUN', 'VERB', 'AUX']:
-                        syntactic_head_token = token
-                        break
-
-                if syntactic_head_token is None:
-                    for token in ancestors:
-                        if token.pos_ == 'NUM':
-                            syntactic_head_token = token
-                            break
-
-        span_start = syntactic_head_token.left_edge.idx
-        span_end = syntactic_head_token.right_edge.idx + len(syntactic_head_token.right_edge.text)
+        span_start, span_end = self.current_resolver.span(fb_head_token.i)
+        self.metrics.add_time('get_head_span', perf_counter() - start)
 
         return span_start, span_end
 
@@ -201,15 +355,8 @@ class FbSentenceProcessor:
         target_token_id = self.catalog_mention(global_sentence_id, target_head,
                                                target_offset_start, target_offset_end)
 
-        # the attitudes table is represented internally as a dictionary of lists, again to help
-        # with the UU -> ROB task
-        attitude_key = (attitude_source_id, target_token_id)
-        if attitude_key in self.attitudes:
-            self.attitudes[attitude_key].append([self.next_attitude_id, attitude_source_id,
-                                                 target_token_id, fact_value, 'Belief'])
-        else:
-            self.attitudes[attitude_key] = [[self.next_attitude_id, attitude_source_id,
-                                             target_token_id, fact_value, 'Belief']]
+        self.attitudes.append(Attitude(self.next_attitude_id, attitude_source_id, target_token_id, fact_value,
+                                       'Belief'))
         self.next_attitude_id += 1
 
     # saving a newly-minted mention for later insertion
@@ -219,49 +366,69 @@ class FbSentenceProcessor:
         # adding the target mention to the aforementioned dictionary of unique mentions
         unique_mention_key = (global_sentence_id, text, target_offset_start, target_offset_end)
         if unique_mention_key not in self.unique_mentions:
+            self.metrics.count('catalog_mention.misses')
             self.unique_mentions[unique_mention_key] = self.next_mention_id
 
             self.current_head = text
             if target_offset_start != -1:
                 span_offset_start, span_offset_end = self.get_head_span(target_offset_start, target_offset_end)
                 span_text = self.current_sentence[span_offset_start:span_offset_end]
-                self.mentions.append((self.next_mention_id, global_sentence_id,
-                                      text, target_offset_start, target_offset_end,
-                                      span_text, span_offset_start, span_offset_end))
+                self.mentions.append(Mention(self.next_mention_id, global_sentence_id,
+                                             text, target_offset_start, target_offset_end,
+                                             span_text, span_offset_start, span_offset_end))
             else:
-                self.mentions.append((self.next_mention_id, global_sentence_id,
-                                      text, target_offset_start, target_offset_end,
-                                      None, None, None))
+                self.mentions.append(Mention(self.next_mention_id, global_sentence_id,
+                                             text, target_offset_start, target_offset_end,
+                                             None, None, None))
 
             global_token_id = self.next_mention_id
             self.next_mention_id += 1
         else:
+            self.metrics.count('catalog_mention.hits')
             global_token_id = self.unique_mentions[unique_mention_key]
 
         return global_token_id
 
+    # saving a new source and indexing it for later find_parent_source calls; the sentence-level
+    # relevant_source_id is only needed for that index, so it is kept there rather than in the row
+    def add_source(self, global_sentence_id, global_source_token_id, parent_source_id,
+                   nesting_level, relevant_source, relevant_source_id):
+        source_id = self.next_source_id
+        self.sources.append(Source(source_id, global_sentence_id, global_source_token_id,
+                                   parent_source_id, nesting_level, relevant_source))
+
+        # the first source to claim a key wins, as it did with the old linear scan
+        self.source_index.setdefault((global_sentence_id, nesting_level, relevant_source_id), source_id)
+
+        # a source's ancestors are itself plus its parent's ancestors, one level further up
+        ancestors = [(source_id, 0)]
+        if parent_source_id not in (None, -1):
+            ancestors += [(ancestor_id, depth + 1) for ancestor_id, depth in self.ancestor_index[parent_source_id]]
+        self.ancestor_index[source_id] = ancestors
+        self.source_ancestors += [SourceAncestor(source_id, ancestor_id, depth) for ancestor_id, depth in ancestors]
+        self.next_source_id += 1
+        return source_id
+
     def find_parent_source(self, global_sentence_id, nesting_level, current_nesting_level, rel_source_id):
         # if a parent source is relevant, find it and catalog it
         if nesting_level == 0:
             parent_source_id = -1
         else:
             parent_relevant_source_id = self.calc_parent_source(rel_source_id)
-            parent_source_id = None
-            for i in range(len(self.sources)):
-                if self.sources[i][1] == global_sentence_id \
-                        and self.sources[i][4] == current_nesting_level - 1 \
-                        and self.sources[i][6] == parent_relevant_source_id:
-                    parent_source_id = i + 1
-                    break
+            parent_source_id = self.source_index.get((global_sentence_id, current_nesting_level - 1,
+                                                      parent_relevant_source_id))
+            # a single index probe since the source index replaced the linear scan; misses leave
+            # the source without a parent
+            self.metrics.count('find_parent_source.lookups')
+            if parent_source_id is None:
+                self.metrics.count('find_parent_source.misses')
 
         return parent_source_id
 
     def get_source_offsets(self, row, relevant_source, rel_source_text):
         # getting the source offsets
         source_offsets_key = (row[self.FILE], row[self.SENTENCE_ID])
-        if source_offsets_key not in self.source_offsets:
-            self.source_offsets[source_offsets_key] = (None, None, relevant_source)
-        source_offsets = self.source_offsets[source_offsets_key]
+        source_offsets = self.source_offsets.get(source_offsets_key, (None, None, relevant_source))
 
         # tweaking offsets as needed
         relevant_source = relevant_source.replace("\\", "")
@@ -301,129 +468,41 @@ class FbSentenceProcessor:
             rel_source_id = rel_source_id[:rel_source_id.index('_')]
         return nesting_level, rel_source_id, source_text
 
-    # changing relevant Uu labels to ROB (reported belief)
-    # in order to more closely match the BEST corpus' annotation style
-    # if bottom of source structure is NOT Uu (GEN and DUMMY do trigger this algo), go up the source tree,
-    # for each intermediate source including the very top, switch Uu to ROB, for the target gotten from the bottom
-    """
-    for each attitude:
-        if label is not Uu:
-            save target_token_id and source_id in variables
-            for each parent source until NULL, find the attitude with the corresponding target_token_id and source_id,
-            and if the label is Uu, change it to ROB
-    :return:
-    """
-    def uu_to_rob(self):
-        num_changes = 0
-        # for each attitude
-        for key in self.attitudes:
-
-            bottom_attitude_list = self.attitudes[key]
-            for bottom_attitude in bottom_attitude_list:
-
-                bottom_label = bottom_attitude[3]
-                if bottom_label != 'Uu':
-
-                    # save target_token_id and source_id in variables
-                    relevant_target_token_id = bottom_attitude[2]
-                    bottom_source = self.sources[bottom_attitude[1] - 1]
-                    parent_source_id = bottom_source[3]
-
-                    # for each parent source until NULL
-                    while parent_source_id not in (None, -1):
-
-                        current_source = self.sources[parent_source_id - 1]
-                        current_source_id = parent_source_id
-                        parent_source_id = current_source[3]
-                        attitude_key = (current_source_id, relevant_target_token_id)
-
-                        # find the attitude with the corresponding target_token_id and source_id
-                        if attitude_key in self.attitudes:
-
-                            current_attitude_list = self.attitudes[attitude_key]
-
-                            for current_attitude in current_attitude_list:
-
-                                # if the label is Uu, change it to ROB
-                                if current_attitude[3] == 'Uu':
-
-                                    current_attitude_list.remove(current_attitude)
-                                    current_attitude[3] = 'ROB'
-                                    current_attitude_list.append(current_attitude)
-                                    self.attitudes[attitude_key] = current_attitude_list
-                                    num_changes += 1
-
-        print('{} changes from Uu to ROB'.format(num_changes))
-
-    # calculating the initial offset, since the indices are file-based and not sentence-based in the DB
+    # placing a head in the sentence, starting from FactBank's offsets (already rebased from file-based
+    # to sentence-based by the loaders)
     def calc_offsets(self, file, sent_id, raw_sentence, offset_start, offset_end, head, rel_source_text):
 
         if (offset_start is None and offset_end is None) or head in [None, 'AUTHOR', 'GEN', 'DUMMY']:
+            self.metrics.count('calc_offsets.skipped')
             return -1, -1, True
 
-        success = False
+        self.metrics.count('calc_offsets.calls')
+        if self.current_aligner is None or self.current_aligner.sentence != raw_sentence:
+            self.current_aligner = HeadAligner(raw_sentence)
+        aligner = self.current_aligner
 
-        if raw_sentence.count(head) == 1:
+        if aligner.count(head) == 1:
             # attempting index method if head exists uniquely in sentence
-            offset_start = raw_sentence.index(head)
+            offset_start = aligner.find_all(head)[0]
             offset_end = offset_start + len(head)
-            pred_head = raw_sentence[offset_start:offset_end]
-            if pred_head != head:
-                success = False
-            else:
-                success = True
-
-        if not success:
-            file_offset = self.initial_offsets[(file, sent_id)]
-            offset_start -= file_offset
+            success = True
+        else:
+            # otherwise taking the occurrence closest to FactBank's own offset
+            self.metrics.count('calc_offsets.fallbacks')
             offset_end = offset_start + len(head)
 
-            left_side_boundary = offset_start
-            right_side_boundary = left_side_boundary + 1
-            search_left = True
-            search_right = True
-
-            while not success:
-                # keeping boundaries in range
-                if left_side_boundary < 0:
-                    search_left = False
-                if right_side_boundary > len(raw_sentence):
-                    search_right = False
-
-                # give up if there's nothing left to search
-                if not search_left and not search_right:
-                    break
-
-                # search both sides at the current boundaries, if there's space left, for the head
-                parts = [(search_left, left_side_boundary), (search_right, right_side_boundary)]
-                for part in parts:
-
-                    search = part[0]
-                    boundary = part[1]
-
-                    if search and raw_sentence[boundary:boundary + len(head)] == head:
-                        offset_start = boundary
-                        offset_end = boundary + len(head)
-                        success = True
-                        break
-
-                # if no match, shift the boundaries
-                left_side_boundary -= 1
-                right_side_boundary += 1
+            nearest = aligner.nearest(head, offset_start)
+            success = nearest is not None
+            if success:
+                offset_start = nearest
+                offset_end = nearest + len(head)
 
-        pred_head = raw_sentence[offset_start:offset_end]
         if not success:
+            self.metrics.count('calc_offsets.failures')
 
-            # keeping the asterisks just for easier understanding of the error dataset
-            result_sentence = raw_sentence[:offset_start] + "* " + head + " *" + raw_sentence[offset_end:]
+            # the annotated result_sentence is left to the errors table, which computes it when read
             self.num_errors += 1
-            error_key = (file, sent_id)
-            entry = (file[1:-1], sent_id, offset_start, offset_end, pred_head, head,
-                     raw_sentence, result_sentence, rel_source_text)
-
-            if error_key not in self.errors:
-                self.errors[error_key] = [entry]
-            else:
-                self.errors[error_key].append(entry)
+            self.errors.append(Error(file[1:-1], sent_id, offset_start, offset_end,
+                                     raw_sentence[offset_start:offset_end], head, raw_sentence, rel_source_text))
 
         return offset_start, offset_end, success
@@ -0,0 +1,137 @@
+# SQL-side loading: factbank_data.db is ATTACHed to the master connection and normalised into
+# indexed TEMP staging tables (quotes stripped, offsets rebased to the sentence), which the
+# sentence processor then reads one key at a time instead of through full-corpus dictionaries
+
+from urllib.request import pathname2url
+
+# every raw FactBank string is wrapped in quotes, and some carry a trailing character as well;
+# these mirror Python's text[1:-1] and text[1:-2] (SQLite's substr counts a negative length backwards)
+STRIP_QUOTES = "substr({0}, 2, max(length({0}) - 2, 0))"
+STRIP_QUOTES_AND_END = "substr({0}, 2, max(length({0}) - 3, 0))"
+
+# the file-based offset of a sentence's first token, for rebasing offsets to the sentence
+INITIAL_OFFSET = ("(SELECT i.offset_init FROM stg_initial_offsets i "
+                  "WHERE i.file = {0}.file AND i.sent_id = {0}.sentId)")
+
+
+class StagedLookup:
+
+    # dictionary-style read access to a staging table, one indexed query per key;
+    # multi lookups return every matching row, the others only the first
+    def __init__(self, con, query, multi=False):
+        self.cur = con.cursor()
+        self.query = query
+        self.multi = multi
+
+    def get(self, key, default=None):
+        rows = self.cur.execute(self.query, key).fetchall()
+        if not rows:
+            return default
+        return rows if self.multi else rows[0]
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+
+class FbStaging:
+
+    # read_only attaches the database with mode=ro, which needs con opened with uri=True (as DDL's is);
+    # mmap_size, if given, memory-maps it (see FB2Master.SOURCE_MODES)
+    def __init__(self, con, path="factbank_data.db", read_only=False, mmap_size=0):
+        self.con = con
+        self.cur = con.cursor()
+        self.path = path
+        self.read_only = read_only
+        self.mmap_size = mmap_size
+
+    # the statements below keep each original loader's FROM clause and join order, so duplicate keys
+    # resolve to the same row the dictionaries kept (the last one, via INSERT OR REPLACE or MAX(seq))
+    def build(self):
+        path = 'file:{}?mode=ro'.format(pathname2url(self.path)) if self.read_only else self.path
+        self.cur.execute('ATTACH DATABASE ? AS fb', (path,))
+        if self.mmap_size:
+            self.cur.execute('PRAGMA fb.mmap_size = {}'.format(self.mmap_size))
+
+        self.cur.execute('CREATE TEMP TABLE stg_initial_offsets ('
+                         'file, sent_id, offset_init,'
+                         'PRIMARY KEY (file, sent_id) )')
+        self.cur.execute('INSERT OR REPLACE INTO stg_initial_offsets '
+                         'SELECT o.file, o.sentId, o.offsetInit FROM fb.offsets o WHERE o.tokLoc = 0')
+
+        self.cur.execute('CREATE TEMP TABLE stg_rel_sources ('
+                         'seq INTEGER PRIMARY KEY, file, sent_id, rel_source_id, rel_source_text )')
+        self.cur.execute('INSERT INTO stg_rel_sources (file, sent_id, rel_source_id, rel_source_text) '
+                         'SELECT file, sentId, {}, {} FROM fb.fb_relSource'
+                         .format(STRIP_QUOTES.format('relSourceId'),
+                                 STRIP_QUOTES_AND_END.format('CAST(relSourceText AS TEXT)')))
+        self.cur.execute('CREATE INDEX temp.stg_rel_sources_key ON stg_rel_sources (file, sent_id, seq)')
+
+        self.cur.execute('CREATE TEMP TABLE stg_source_offsets ('
+                         'file, sent_id, offset_start, offset_end, source_text,'
+                         'PRIMARY KEY (file, sent_id) )')
+        self.cur.execute('INSERT OR REPLACE INTO stg_source_offsets '
+                         'SELECT s.file, s.sentId, o.offsetInit - {0}, o.offsetEnd - {0}, {1} '
+                         'FROM fb.fb_source s JOIN fb.offsets o '
+                         'ON s.file = o.file AND s.sentId = o.sentId '
+                         'AND s.sourceLoc = o.tokLoc'
+                         .format(INITIAL_OFFSET.format('s'), STRIP_QUOTES_AND_END.format('CAST(o.text AS TEXT)')))
+
+        self.cur.execute('CREATE TEMP TABLE stg_offsets ('
+                         'file, sent_id, tok_loc, offset_start, offset_end,'
+                         'PRIMARY KEY (file, sent_id, tok_loc) )')
+        self.cur.execute('INSERT OR REPLACE INTO stg_offsets '
+                         'SELECT file, sentId, tokLoc, offsetInit - {0}, offsetEnd - {0} FROM fb.offsets'
+                         .format(INITIAL_OFFSET.format('offsets')))
+
+        # targets are joined to their offsets here, so the processor never sees a tokLoc
+        self.cur.execute('CREATE TEMP TABLE stg_target_tokens ('
+                         'file, sent_id, eid, tok_loc, head,'
+                         'PRIMARY KEY (file, sent_id, eid) )')
+        self.cur.execute("INSERT OR REPLACE INTO stg_target_tokens "
+                         "SELECT o.file, o.sentId, o.tmlTagId, o.tokLoc, replace({}, '\\', '') "
+                         "FROM fb.tokens_tml o "
+                         "JOIN fb.fb_factValue t ON o.file = t.file "
+                         "AND o.sentId = t.sentId AND o.tmlTagId = t.eId"
+                         .format(STRIP_QUOTES.format('t.eText')))
+        self.cur.execute('CREATE TEMP TABLE stg_targets AS '
+                         'SELECT t.file, t.sent_id, t.eid, t.head, o.offset_start, o.offset_end '
+                         'FROM stg_target_tokens t JOIN stg_offsets o '
+                         'ON t.file = o.file AND t.sent_id = o.sent_id AND t.tok_loc = o.tok_loc')
+        self.cur.execute('CREATE INDEX temp.stg_targets_key ON stg_targets (file, sent_id, eid)')
+        self.cur.execute('DROP TABLE stg_target_tokens')
+        self.cur.execute('DROP TABLE stg_offsets')
+
+        self.cur.execute('CREATE TEMP TABLE stg_fact_values ('
+                         'seq INTEGER PRIMARY KEY, file, sent_id, rel_source_id, eid, fact_value )')
+        self.cur.execute('INSERT INTO stg_fact_values (file, sent_id, rel_source_id, eid, fact_value) '
+                         'SELECT file, sentId, {}, eId, {} FROM fb.fb_factValue'
+                         .format(STRIP_QUOTES.format('relSourceId'), STRIP_QUOTES_AND_END.format('factValue')))
+        self.cur.execute('CREATE INDEX temp.stg_fact_values_key '
+                         'ON stg_fact_values (file, sent_id, rel_source_id, seq)')
+
+    # the four lookups FbSentenceProcessor reads, in its constructor order
+    def lookups(self):
+        rel_source_texts = StagedLookup(self.con, 'SELECT rel_source_id, rel_source_text FROM stg_rel_sources '
+                                                  'WHERE file = ? AND sent_id = ? ORDER BY seq', multi=True)
+        source_offsets = StagedLookup(self.con, 'SELECT offset_start, offset_end, source_text '
+                                                'FROM stg_source_offsets WHERE file = ? AND sent_id = ?')
+        targets = StagedLookup(self.con, 'SELECT head, offset_start, offset_end FROM stg_targets '
+                                         'WHERE file = ? AND sent_id = ? AND eid = ?')
+        fact_values = StagedLookup(self.con, 'SELECT eid, fact_value FROM stg_fact_values '
+                                             'WHERE file = ? AND sent_id = ? AND rel_source_id = ? ORDER BY seq',
+                                   multi=True)
+        return rel_source_texts, source_offsets, targets, fact_values
+
+    # streaming the sentences straight from the attached database
+    def sentences(self, query, params=()):
+        return self.con.cursor().execute(query, params)
+
+    def close(self):
+        for table in ['stg_initial_offsets', 'stg_rel_sources', 'stg_source_offsets',
+                      'stg_targets', 'stg_fact_values']:
+            self.cur.execute('DROP TABLE IF EXISTS temp.{}'.format(table))
+        self.con.commit()
+        self.cur.execute('DETACH DATABASE fb')
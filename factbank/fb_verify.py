@@ -0,0 +1,208 @@
+# differential verifier for two master databases, e.g. a reference serial build and a build made with
+# --workers, --stream, --pipeline or --parse-cache: every table is hashed file by file first, and only
+# the files whose hashes differ are read back in full and diffed row by row
+#
+# rows are compared by content, with every ID replaced by what it points at (a sentence by its file and
+# file_sentence_id, a mention by its text and offsets, a source by its text and nesting level), since
+# incremental and resumed builds number their rows differently; --ids compares the IDs as well
+
+import argparse
+import re
+import sqlite3
+import sys
+from hashlib import sha1
+
+# (table, file column, ID columns, content columns, FROM clause); the file column is what the rows are
+# grouped and hashed by. A table is only compared where every table its FROM clause reads exists, so
+# that a database from before source_ancestors (say) can still be checked against a newer one
+TABLES = [
+    ('sentences', 's.file', ['s.sentence_id'],
+     ['s.file_sentence_id', 's.sentence'],
+     'sentences s'),
+    ('mentions', 's.file', ['m.token_id', 'm.sentence_id'],
+     ['s.file_sentence_id', 'm.token_text', 'm.token_offset_start', 'm.token_offset_end', 'm.phrase_text',
+      'm.phrase_offset_start', 'm.phrase_offset_end'],
+     'mentions m JOIN sentences s ON s.sentence_id = m.sentence_id'),
+    ('sources', 's.file', ['so.source_id', 'so.sentence_id', 'so.token_id', 'so.parent_source_id'],
+     ['s.file_sentence_id', 'so.[source]', 'so.nesting_level', 'm.token_text', 'm.token_offset_start',
+      'p.[source]', 'p.nesting_level'],
+     'sources so JOIN sentences s ON s.sentence_id = so.sentence_id '
+     'JOIN mentions m ON m.token_id = so.token_id LEFT JOIN sources p ON p.source_id = so.parent_source_id'),
+    ('source_ancestors', 's.file', ['sa.source_id', 'sa.ancestor_source_id'],
+     ['s.file_sentence_id', 'so.[source]', 'so.nesting_level', 'an.[source]', 'an.nesting_level', 'sa.depth'],
+     'source_ancestors sa JOIN sources so ON so.source_id = sa.source_id '
+     'JOIN sources an ON an.source_id = sa.ancestor_source_id JOIN sentences s ON s.sentence_id = so.sentence_id'),
+    ('attitudes', 's.file', ['a.attitude_id', 'a.source_id', 'a.target_token_id'],
+     ['s.file_sentence_id', 'so.[source]', 'so.nesting_level', 'sm.token_offset_start', 'tm.token_text',
+      'tm.token_offset_start', 'tm.token_offset_end', 'a.label', 'a.label_type'],
+     'attitudes a JOIN sources so ON so.source_id = a.source_id JOIN sentences s ON s.sentence_id = so.sentence_id '
+     'JOIN mentions sm ON sm.token_id = so.token_id JOIN mentions tm ON tm.token_id = a.target_token_id'),
+    ('errors', 'e.file', ['e.error_id'],
+     ['e.file_sentence_id', 'e.offset_start', 'e.offset_end', 'e.predicted_head', 'e.head', 'e.raw_sentence',
+      'e.result_sentence', 'e.rel_source_text'],
+     'errors e'),
+]
+
+# SQLite's ordering across storage classes, so rows sort the same way in Python as in ORDER BY
+TYPE_ORDER = {type(None): 0, int: 1, float: 1, str: 2, bytes: 3}
+
+
+def sort_key(row):
+    return tuple((TYPE_ORDER[type(value)], value) for value in row)
+
+
+class MasterVerifier:
+
+    # ids includes the ID columns in every comparison; limit is the number of differences shown per
+    # table, each with up to context matching rows around it
+    def __init__(self, reference, candidate, ids=False, limit=10, context=2):
+        self.paths = [reference, candidate]
+        self.cons = [sqlite3.connect(path) for path in self.paths]
+        self.ids = ids
+        self.limit = limit
+        self.context = context
+
+    def columns(self, id_columns, columns):
+        return (id_columns if self.ids else []) + columns
+
+    # whether every table a FROM clause reads exists in the database
+    @staticmethod
+    def readable(con, source):
+        tables = set(re.findall(r'(?:^|JOIN )(\w+)', source))
+        existing = {row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return tables <= existing
+
+    # {file: hex digest} over a table's rows in one database, each file's hash updated row by row
+    # as the ordered rows stream past
+    def file_hashes(self, con, file_column, columns, source):
+        select = ', '.join([file_column] + columns)
+        query = 'SELECT {} FROM {} ORDER BY {}'.format(select, source, ', '.join(str(i + 1) for i in
+                                                                                range(len(columns) + 1)))
+        hashes = {}
+        file_hash = None
+        current = None
+        for row in con.execute(query):
+            if row[0] != current:
+                current = row[0]
+                file_hash = hashes[current] = sha1()
+            file_hash.update(repr(row[1:]).encode('utf-8'))
+        return {file: file_hash.hexdigest() for file, file_hash in hashes.items()}
+
+    def file_rows(self, con, file_column, columns, source, file):
+        rows = con.execute('SELECT {} FROM {} WHERE {} = ?'.format(', '.join(columns), source, file_column),
+                           (file,)).fetchall()
+        return sorted(rows, key=sort_key)
+
+    # merging two sorted row lists into diff lines: (' ', row) on both sides, ('-', row) only in the
+    # reference, ('+', row) only in the candidate
+    @staticmethod
+    def merge(reference_rows, candidate_rows):
+        lines = []
+        i = j = 0
+        while i < len(reference_rows) or j < len(candidate_rows):
+            if j == len(candidate_rows):
+                lines.append(('-', reference_rows[i]))
+                i += 1
+            elif i == len(reference_rows):
+                lines.append(('+', candidate_rows[j]))
+                j += 1
+            else:
+                left, right = sort_key(reference_rows[i]), sort_key(candidate_rows[j])
+                if left == right:
+                    lines.append((' ', reference_rows[i]))
+                    i += 1
+                    j += 1
+                elif left < right:
+                    lines.append(('-', reference_rows[i]))
+                    i += 1
+                else:
+                    lines.append(('+', candidate_rows[j]))
+                    j += 1
+        return lines
+
+    # the differing lines, each with up to context matching lines around it; hunks are separated by None
+    def hunks(self, lines):
+        keep = set()
+        for index, (marker, _) in enumerate(lines):
+            if marker != ' ':
+                keep.update(range(max(index - self.context, 0), min(index + self.context + 1, len(lines))))
+        shown = []
+        previous = None
+        for index in sorted(keep):
+            if previous is not None and index != previous + 1:
+                shown.append(None)
+            shown.append(lines[index])
+            previous = index
+        return shown
+
+    # comparing one table; returns the number of differing rows. A table readable in only one database
+    # differs by all of its rows (and by at least one, even if it is empty); one readable in neither is
+    # skipped
+    def verify_table(self, table, file_column, id_columns, columns, source):
+        readable = [self.readable(con, source) for con in self.cons]
+        if not all(readable):
+            if not any(readable):
+                print('{:<18} skipped, not in either database'.format(table))
+                return 0
+            side = readable.index(True)
+            num_rows = self.cons[side].execute('SELECT COUNT(*) FROM {}'.format(source)).fetchone()[0]
+            print('{:<18} only in the {} ({} rows)'.format(table, ['reference', 'candidate'][side], num_rows))
+            return max(num_rows, 1)
+
+        columns = self.columns(id_columns, columns)
+        reference_hashes, candidate_hashes = [self.file_hashes(con, file_column, columns, source)
+                                              for con in self.cons]
+        files = sorted(set(reference_hashes) | set(candidate_hashes), key=lambda file: sort_key((file,)))
+        differing = [file for file in files if reference_hashes.get(file) != candidate_hashes.get(file)]
+
+        num_differences = 0
+        shown = 0
+        report = []
+        for file in differing:
+            lines = self.merge(*[self.file_rows(con, file_column, columns, source, file) for con in self.cons])
+            differences = sum(marker != ' ' for marker, _ in lines)
+            num_differences += differences
+            if shown < self.limit:
+                report.append('  file {}: {} differing rows'.format(file, differences))
+                for line in self.hunks(lines):
+                    if line is None:
+                        report.append('    ...')
+                        continue
+                    marker, row = line
+                    if marker != ' ':
+                        if shown == self.limit:
+                            report.append('    ...')
+                            break
+                        shown += 1
+                    report.append('    {} {}'.format(marker, row))
+
+        print('{:<18} {:>6} files {:>6} differ {:>8} differing rows'.format(table, len(files), len(differing),
+                                                                          num_differences))
+        if report:
+            print('  ({})'.format(', '.join(columns).replace('[', '').replace(']', '')))
+            print('\n'.join(report))
+        return num_differences
+
+    def verify(self):
+        print('- {}\n+ {}\n'.format(*self.paths))
+        return sum(self.verify_table(*table) for table in TABLES)
+
+    def close(self):
+        for con in self.cons:
+            con.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare two master databases table by table.')
+    parser.add_argument('reference', help='e.g. fb_master.db from a serial build')
+    parser.add_argument('candidate', help='the build to check against it')
+    parser.add_argument('--ids', action='store_true', help='compare IDs too, not just what they point at')
+    parser.add_argument('--limit', type=int, default=10, help='differing rows shown per table')
+    parser.add_argument('--context', type=int, default=2, help='matching rows shown around each difference')
+    args = parser.parse_args()
+
+    verifier = MasterVerifier(args.reference, args.candidate, ids=args.ids, limit=args.limit, context=args.context)
+    differences = verifier.verify()
+    verifier.close()
+    print('\n{} differing rows'.format(differences) if differences else '\nNo differences.')
+    sys.exit(1 if differences else 0)
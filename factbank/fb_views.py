@@ -0,0 +1,130 @@
+# the BASIC and SPAN queries in queries.sql, materialised as the attitude_basic and attitude_span
+# tables (see ddl.py) so that analysis doesn't redo their joins, SUBSTRs and DISTINCT on every call,
+# and a small query API over them
+
+import argparse
+import sqlite3
+from time import perf_counter
+
+# every join is on a primary key, so each attitude yields exactly one row and the SPAN query's
+# DISTINCT has nothing to remove; spans are read from mentions.phrase_text, the same text the SPAN
+# query's SUBSTRs cut out of the sentence
+ATTITUDE_BASIC_SELECT = """
+SELECT a.attitude_id, s.sentence_id, s.sentence, s.file, s.file_sentence_id, tm.token_text,
+       tm.token_offset_start, tm.token_offset_end, tm.token_id, a.label, sm.token_text,
+       sm.token_offset_start, sm.token_offset_end, sm.token_id, src.source_id, src.nesting_level
+FROM attitudes a
+    JOIN mentions tm ON tm.token_id = a.target_token_id
+    JOIN sentences s ON tm.sentence_id = s.sentence_id
+    JOIN sources src ON src.source_id = a.source_id
+    JOIN mentions sm ON sm.token_id = src.token_id
+WHERE a.attitude_id NOT IN (SELECT attitude_id FROM attitude_basic)"""
+
+ATTITUDE_SPAN_SELECT = """
+SELECT a.attitude_id, s.sentence_id, s.sentence, s.file, s.file_sentence_id, tm.token_text,
+       tm.token_offset_start, tm.token_offset_end, tm.phrase_offset_start, tm.phrase_offset_end,
+       tm.phrase_text, tm.token_id, a.label, sm.token_text, src.nesting_level,
+       sm.token_offset_start, sm.token_offset_end, sm.phrase_offset_start, sm.phrase_offset_end,
+       sm.phrase_text, sm.token_id, src.parent_source_id, src.source_id
+FROM attitudes a
+    JOIN mentions tm ON tm.token_id = a.target_token_id
+    JOIN sentences s ON tm.sentence_id = s.sentence_id
+    JOIN sources src ON src.source_id = a.source_id
+    JOIN mentions sm ON sm.token_id = src.token_id
+WHERE a.attitude_id NOT IN (SELECT attitude_id FROM attitude_span)"""
+
+VIEW_QUERIES = [('attitude_basic', ATTITUDE_BASIC_SELECT), ('attitude_span', ATTITUDE_SPAN_SELECT)]
+
+# the columns filters can be put on: {keyword: column}
+FILTERS = {'file': 'file', 'label': 'label', 'nesting_level': 'nesting_level', 'source_id': 'source_id',
+           'source': 'source_text'}
+
+
+# bringing both tables in line with the base tables: attitude IDs are never reused and an attitude
+# doesn't change once its build has finished (uu_to_rob only visits the build's own attitudes), so
+# dropping the rows of deleted attitudes and adding the missing ones is a full refresh; a fresh
+# database just gets every row; returns the number of rows added per table
+def refresh_views(cur):
+    added = {}
+    for table, select in VIEW_QUERIES:
+        cur.execute('DELETE FROM {} WHERE attitude_id NOT IN (SELECT attitude_id FROM attitudes)'.format(table))
+        cur.execute('INSERT INTO {} {}'.format(table, select))
+        added[table] = cur.rowcount
+    return added
+
+
+class AttitudeViews:
+
+    def __init__(self, master='fb_master.db'):
+        self.con = sqlite3.connect(master)
+        self.con.row_factory = sqlite3.Row
+
+    # the WHERE clause and its parameters for the given filters; each filter is a single value or
+    # a list of values, any of which may match
+    @staticmethod
+    def where(filters):
+        conditions = []
+        params = []
+        for keyword, value in filters.items():
+            if value is None:
+                continue
+            if keyword not in FILTERS:
+                raise ValueError('cannot filter on {}'.format(keyword))
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            conditions.append('{} IN ({})'.format(FILTERS[keyword], ', '.join('?' * len(values))))
+            params += values
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+    # rows of attitude_basic (or attitude_span, with spans=True) matching every filter, in attitude order
+    def attitudes(self, spans=False, limit=None, **filters):
+        where, params = self.where(filters)
+        query = 'SELECT * FROM {}{} ORDER BY attitude_id'.format('attitude_span' if spans else 'attitude_basic',
+                                                                where)
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        return self.con.execute(query, params).fetchall()
+
+    def basic(self, limit=None, **filters):
+        return self.attitudes(False, limit, **filters)
+
+    def spans(self, limit=None, **filters):
+        return self.attitudes(True, limit, **filters)
+
+    # {label: number of attitudes} matching the filters
+    def label_counts(self, **filters):
+        where, params = self.where(filters)
+        return dict(self.con.execute('SELECT label, COUNT(*) FROM attitude_basic{} GROUP BY label'.format(where),
+                                     params).fetchall())
+
+    def close(self):
+        self.con.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query the precomputed attitude tables of fb_master.db.')
+    parser.add_argument('--master', default='fb_master.db')
+    parser.add_argument('--spans', action='store_true', help='read attitude_span instead of attitude_basic')
+    parser.add_argument('--file', nargs='+', help='file names, without the quotes FactBank keeps around them')
+    parser.add_argument('--label', nargs='+')
+    parser.add_argument('--nesting-level', type=int, nargs='+')
+    parser.add_argument('--source-id', type=int, nargs='+')
+    parser.add_argument('--source', nargs='+', help='source head text, e.g. AUTHOR')
+    parser.add_argument('--limit', type=int, default=20, help='number of rows to print')
+    parser.add_argument('--refresh', action='store_true',
+                        help='bring the tables up to date first (fb2master.py does this after every build)')
+    args = parser.parse_args()
+
+    views = AttitudeViews(args.master)
+    if args.refresh:
+        print(refresh_views(views.con.cursor()))
+        views.con.commit()
+    filters = {'file': args.file, 'label': args.label, 'nesting_level': args.nesting_level,
+               'source_id': args.source_id, 'source': args.source}
+    start = perf_counter()
+    rows = views.attitudes(args.spans, args.limit, **filters)
+    elapsed = perf_counter() - start
+    for row in rows:
+        print('\t'.join(str(value) for value in row))
+    print('{} rows in {:.2f} ms'.format(len(rows), elapsed * 1000))
+    views.close()
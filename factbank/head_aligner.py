@@ -0,0 +1,69 @@
+# occurrence index over a single sentence, used by FbSentenceProcessor.calc_offsets to place heads;
+# every occurrence of a head is found once per sentence, however many sources and targets share it
+
+from bisect import bisect_left, bisect_right
+
+
+class HeadAligner:
+
+    def __init__(self, sentence):
+        self.sentence = sentence
+        # head -> sorted start positions of every (possibly overlapping) occurrence
+        self.occurrences = {}
+        # head -> number of non-overlapping occurrences, i.e. str.count
+        self.counts = {}
+
+    def find_all(self, head):
+        if head not in self.occurrences:
+            positions = []
+            position = self.sentence.find(head)
+            while position != -1:
+                positions.append(position)
+                position = self.sentence.find(head, position + 1)
+            self.occurrences[head] = positions
+
+            # str.count skips overlapping matches, and the unique-head test depends on that
+            count = 0
+            next_free = 0
+            for position in positions:
+                if position >= next_free:
+                    count += 1
+                    next_free = position + len(head)
+            self.counts[head] = count
+
+        return self.occurrences[head]
+
+    def count(self, head):
+        self.find_all(head)
+        return self.counts[head]
+
+    # the occurrence the old expanding-window search would have landed on: it tried offset - k, then
+    # offset + 1 + k, for k = 0, 1, 2, ..., so ties go to the left; None if the head never occurs
+    def nearest(self, head, offset):
+        if not head:
+            # an empty head "matches" at any boundary the window visits, in range or not
+            return offset if offset >= 0 else offset + 1
+
+        positions = self.find_all(head)
+        if not positions:
+            return None
+
+        if offset < 0:
+            # only the right-hand boundary moves here, and while it is still negative, slicing counts from
+            # the end of the sentence: a head occurring at p is "found" at p - len(sentence) once the window
+            # reaches it with the slice's end still negative
+            length = len(self.sentence)
+            i = bisect_left(positions, max(length + offset + 1, 0))
+            if i < len(positions) and positions[i] <= length - len(head) - 1:
+                return positions[i] - length
+            return positions[0]
+
+        i = bisect_right(positions, offset)
+        left = positions[i - 1] if i > 0 else None
+        right = positions[i] if i < len(positions) else None
+
+        if right is None:
+            return left
+        if left is None:
+            return right
+        return left if offset - left <= right - offset - 1 else right
@@ -0,0 +1,166 @@
+# instrumentation for the converter: named timers, counters and gauges, plus progress reporting,
+# all fanned out to pluggable sinks (progress bars, JSON lines, a summary table)
+
+import json
+import sys
+from time import perf_counter, time
+from progress.bar import Bar
+
+
+class Timer:
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.add_time(self.name, perf_counter() - self.start)
+        return False
+
+
+class Progress:
+
+    # progress over a known number of steps; sinks decide whether and how it is shown
+    def __init__(self, metrics, name, total):
+        self.metrics = metrics
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.handles = [sink.start_progress(name, total) for sink in metrics.sinks]
+
+    def next(self, n=1):
+        self.done += n
+        for handle in self.handles:
+            if handle is not None:
+                handle.next(n)
+
+    def finish(self):
+        for handle in self.handles:
+            if handle is not None:
+                handle.finish()
+
+
+class Metrics:
+
+    def __init__(self, sinks=None):
+        self.sinks = sinks if sinks is not None else []
+        self.timers = {}    # name -> [seconds, calls]
+        self.counters = {}  # name -> count
+        self.gauges = {}    # name -> [last, max]
+
+    def timer(self, name):
+        return Timer(self, name)
+
+    def add_time(self, name, seconds, calls=1):
+        timer = self.timers.setdefault(name, [0.0, 0])
+        timer[0] += seconds
+        timer[1] += calls
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        gauge = self.gauges.setdefault(name, [value, value])
+        gauge[0] = value
+        gauge[1] = max(gauge[1], value)
+
+    def seconds(self, name):
+        return self.timers.get(name, [0.0, 0])[0]
+
+    def progress(self, name, total):
+        return Progress(self, name, total)
+
+    # a one-off event, e.g. a finished stage
+    def emit(self, event, **fields):
+        for sink in self.sinks:
+            sink.event(event, fields)
+
+    def snapshot(self):
+        return {'timers': {name: {'seconds': round(seconds, 6), 'calls': calls}
+                           for name, (seconds, calls) in self.timers.items()},
+                'counters': dict(self.counters),
+                'gauges': {name: {'last': last, 'max': peak} for name, (last, peak) in self.gauges.items()}}
+
+    # folding in a snapshot taken elsewhere, e.g. in a worker process
+    def merge(self, snapshot):
+        for name, timer in snapshot['timers'].items():
+            self.add_time(name, timer['seconds'], timer['calls'])
+        for name, count in snapshot['counters'].items():
+            self.count(name, count)
+        for name, gauge in snapshot['gauges'].items():
+            self.gauge(name, gauge['max'])
+
+    def close(self):
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.close(snapshot)
+
+
+class Sink:
+
+    def start_progress(self, name, total):
+        return None
+
+    def event(self, event, fields):
+        pass
+
+    def close(self, snapshot):
+        pass
+
+
+# the converter's traditional console progress bars, now sized from real row counts
+class ProgressBarSink(Sink):
+
+    def start_progress(self, name, total):
+        return Bar(name, max=max(total, 1))
+
+
+# one JSON object per line: every event as it happens, then a final summary
+class JsonLinesSink(Sink):
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w')
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def event(self, event, fields):
+        record = {'event': event, 'time': round(time(), 3)}
+        record.update(fields)
+        self.write(record)
+
+    def close(self, snapshot):
+        record = {'event': 'summary', 'time': round(time(), 3)}
+        record.update(snapshot)
+        self.write(record)
+        self.file.close()
+
+
+class SummaryTableSink(Sink):
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+
+    def close(self, snapshot):
+        lines = ['', '{:<40} {:>12} {:>10} {:>12}'.format('timer', 'seconds', 'calls', 'ms/call')]
+        for name, timer in sorted(snapshot['timers'].items()):
+            per_call = 1000 * timer['seconds'] / timer['calls'] if timer['calls'] else 0.0
+            lines.append('{:<40} {:>12.4f} {:>10} {:>12.4f}'.format(name, timer['seconds'], timer['calls'], per_call))
+        if snapshot['counters']:
+            lines.append('')
+            lines.append('{:<40} {:>12}'.format('counter', 'count'))
+            for name, count in sorted(snapshot['counters'].items()):
+                lines.append('{:<40} {:>12}'.format(name, count))
+        if snapshot['gauges']:
+            lines.append('')
+            lines.append('{:<40} {:>12} {:>10}'.format('gauge', 'last', 'max'))
+            for name, gauge in sorted(snapshot['gauges'].items()):
+                lines.append('{:<40} {:>12} {:>10}'.format(name, gauge['last'], gauge['max']))
+        print('\n'.join(lines), file=self.stream)
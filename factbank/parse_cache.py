@@ -0,0 +1,67 @@
+# persistent cache of spaCy parses, stored in a small SQLite file next to the master database;
+# entries are keyed by a hash of the cleaned sentence text and the model that parsed it
+
+import sqlite3
+from hashlib import sha1
+from spacy.tokens import Doc
+from spacy.vocab import Vocab
+
+
+class ParseCache:
+
+    # serialized Docs don't need their tensors or user data to answer head-span questions
+    EXCLUDE = ['tensor', 'user_data']
+
+    # serialized Docs carry their own strings, so a fresh Vocab is enough to read them back
+    # without loading the model
+    def __init__(self, path, model_id, vocab=None):
+        self.model_id = model_id
+        self.vocab = vocab if vocab is not None else Vocab()
+        self.hits = 0
+        self.misses = 0
+
+        self.con = sqlite3.connect(path, timeout=60)
+        self.cur = self.con.cursor()
+        self.cur.execute('CREATE TABLE IF NOT EXISTS parses ('
+                         'parse_key CHAR(40) PRIMARY KEY,'
+                         'model VARCHAR2(255),'
+                         'doc BLOB )')
+
+        # invalidating anything written by a different model or model version
+        self.cur.execute('DELETE FROM parses WHERE model != ?', (self.model_id,))
+        self.con.commit()
+
+    # e.g. 'en_core_web_sm==3.7.1'
+    @staticmethod
+    def get_model_id(nlp):
+        return '{}_{}=={}'.format(nlp.meta['lang'], nlp.meta['name'], nlp.meta['version'])
+
+    def make_key(self, text):
+        return sha1('{}\n{}'.format(self.model_id, text).encode('utf-8')).hexdigest()
+
+    # returning a {text: Doc} dictionary for every text already in the cache
+    def get_many(self, texts):
+        keys = {self.make_key(text): text for text in texts}
+        found = {}
+        key_list = list(keys)
+        # staying under SQLite's bound-parameter limit
+        for i in range(0, len(key_list), 500):
+            chunk = key_list[i:i + 500]
+            rows = self.cur.execute('SELECT parse_key, doc FROM parses WHERE parse_key IN ({})'
+                                    .format(', '.join('?' * len(chunk))), chunk)
+            for parse_key, doc_bytes in rows:
+                found[keys[parse_key]] = Doc(self.vocab).from_bytes(doc_bytes, exclude=self.EXCLUDE)
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, docs):
+        self.cur.executemany('INSERT OR REPLACE INTO parses (parse_key, model, doc) VALUES (?, ?, ?)',
+                             [(self.make_key(doc.text), self.model_id, doc.to_bytes(exclude=self.EXCLUDE))
+                              for doc in docs])
+        self.con.commit()
+
+    def close(self):
+        self.con.commit()
+        self.con.close()
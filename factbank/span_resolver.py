@@ -0,0 +1,69 @@
+# per-Doc memo of head spans: the syntactic head get_head_span picks for a token, and that head's
+# phrase offsets, read from arrays pulled out of the Doc once instead of through Token attributes
+# on every mention; tokens that share an ancestor chain share the walk up it
+
+from spacy.attrs import HEAD, POS, DEP, IDX, LENGTH
+from spacy.symbols import PRON, PROPN, NOUN, VERB, AUX, NUM
+
+HEAD_POS = {PRON, PROPN, NOUN, VERB, AUX}
+
+# marks a memo slot that hasn't been filled in yet (None is a valid answer)
+UNKNOWN = -2
+
+
+class SpanResolver:
+
+    def __init__(self, doc):
+        self.doc = doc
+        # to_array hands back unsigned integers, but HEAD is relative to the token (often negative);
+        # a token that is its own head (relative head 0) ends an ancestor chain
+        self.relative_heads, self.pos, self.deps, self.starts, self.lengths = \
+            doc.to_array([HEAD, POS, DEP, IDX, LENGTH]).view('int64').T.tolist()
+        self.root = doc.vocab.strings['ROOT']
+
+        n = len(doc)
+        self.first_head_pos = [UNKNOWN] * n
+        self.first_num = [UNKNOWN] * n
+        self.spans = {}
+
+    # the first token in i's chain (i, then its ancestors) whose POS is in pos_set, or None;
+    # memo holds the answer for every token already walked
+    def first_in_chain(self, i, pos_set, memo):
+        chain = []
+        found = None
+        while True:
+            if memo[i] != UNKNOWN:
+                found = memo[i]
+                break
+            chain.append(i)
+            if self.pos[i] in pos_set:
+                found = i
+                break
+            if self.relative_heads[i] == 0:
+                break
+            i += self.relative_heads[i]
+
+        # a token that doesn't qualify itself shares its head's answer
+        for j in chain:
+            memo[j] = j if self.pos[j] in pos_set else found
+        return found
+
+    # the token get_head_span takes the phrase of: a root as is, otherwise the nearest noun, verb
+    # or pronoun among the token and its ancestors, falling back to the nearest number
+    def syntactic_head(self, i):
+        if self.deps[i] == self.root or self.relative_heads[i] == 0:
+            return i
+        head = self.first_in_chain(i, HEAD_POS, self.first_head_pos)
+        if head is None:
+            head = self.first_in_chain(i, {NUM}, self.first_num)
+        return head
+
+    # (span_start, span_end) of the phrase headed by token i's syntactic head
+    def span(self, i):
+        head = self.syntactic_head(i)
+        if head not in self.spans:
+            # as before, a chain with no usable head is an error
+            token = self.doc[head] if head is not None else None
+            right_edge = token.right_edge.i
+            self.spans[head] = (self.starts[token.left_edge.i], self.starts[right_edge] + self.lengths[right_edge])
+        return self.spans[head]
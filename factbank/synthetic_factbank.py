@@ -0,0 +1,125 @@
+# writes a synthetic database in FactBank's raw schema (sentences, offsets, tokens_tml, fb_factValue,
+# fb_relSource, fb_source), quoting and all, so the converter can be run and measured without the
+# licensed factbank_data.db
+
+import argparse
+import random
+import sqlite3
+from os import remove
+from os.path import exists
+
+NAMES = ['john', 'mary', 'the-minister', 'analysts', 'the-company', 'officials', 'reuters', 'sources']
+EVENTS = ['said', 'rise', 'fall', 'claimed', 'reported', 'expects', 'denied', 'announced', 'believes', 'sold']
+FILLER = ['the', 'bank', 'will', 'that', 'it', 'rates', 'and', 'in', 'on', 'market', 'shares', 'week',
+          'percent', 'a', 'of', 'to', 'deal', 'year', 'investors', '``', "''"]
+FACT_VALUES = ['CT+', 'CT-', 'PR+', 'PR-', 'PS+', 'PS-', 'Uu', 'CTu']
+
+
+class SyntheticFactBank:
+
+    def __init__(self, path, files=10, sentences=20, depth=2, ambiguity=0.3, drift=0.1, missing=0.05,
+                 events=3, seed=0):
+        self.path = path
+        self.files = files
+        self.sentences = sentences
+        self.depth = depth          # deepest source nesting level, 0 for author-only annotations
+        self.ambiguity = ambiguity  # chance that a head word occurs more than once in its sentence
+        self.drift = drift          # chance that a sentence's FactBank offsets are off by a few characters
+        self.missing = missing      # chance that a target head does not occur in its sentence at all
+        self.events = events        # most targets per sentence
+        self.rng = random.Random(seed)
+
+    def generate(self):
+        if exists(self.path):
+            remove(self.path)
+        con = sqlite3.connect(self.path)
+        cur = con.cursor()
+        cur.execute('CREATE TABLE sentences (file, sentId, sent)')
+        cur.execute('CREATE TABLE offsets (file, sentId, tokLoc, offsetInit, offsetEnd, text)')
+        cur.execute('CREATE TABLE tokens_tml (file, sentId, tokLoc, tmlTagId)')
+        cur.execute('CREATE TABLE fb_factValue (file, sentId, relSourceId, eId, eText, factValue)')
+        cur.execute('CREATE TABLE fb_relSource (file, sentId, relSourceId, relSourceText)')
+        cur.execute('CREATE TABLE fb_source (file, sentId, sourceLoc)')
+
+        for file_number in range(self.files):
+            file_name = "'synth_{:05d}.tml'".format(file_number)
+            file_offset = 0
+            # FactBank's sentence 0 is the document header, which the converter skips
+            for sent_id in range(self.sentences + 1):
+                file_offset = self.generate_sentence(cur, file_name, sent_id, file_offset)
+
+        con.commit()
+        con.close()
+
+    # nested sources: AUTHOR is s0, and every other source hangs off one on the level above,
+    # e.g. ('s2_s1_s0', 'mary_john_AUTHOR', 2)
+    def make_sources(self):
+        sources = [('s0', 'AUTHOR', 0, None)]
+        names = self.rng.sample(NAMES, self.rng.randint(0, min(self.depth * 2, len(NAMES))))
+        for local_id, name in enumerate(names, start=1):
+            candidates = [source for source in sources if source[2] < self.depth]
+            parent = self.rng.choice(candidates)
+            sources.append(('s{}_{}'.format(local_id, parent[0]), '{}_{}'.format(name, parent[1]),
+                            parent[2] + 1, name))
+        return sources
+
+    def generate_sentence(self, cur, file_name, sent_id, file_offset):
+        sources = self.make_sources()
+        events = self.rng.sample(EVENTS, self.rng.randint(1, self.events))
+
+        tokens = [self.rng.choice(FILLER) for _ in range(self.rng.randint(4, 16))]
+        heads = [source[3] for source in sources if source[3] is not None] + events
+        for head in heads:
+            copies = 2 if self.rng.random() < self.ambiguity else 1
+            for _ in range(copies):
+                tokens.insert(self.rng.randint(0, len(tokens)), head)
+
+        sentence = ' '.join(tokens)
+        cur.execute('INSERT INTO sentences VALUES (?, ?, ?)', (file_name, sent_id, "'{}'\n".format(sentence)))
+
+        # a drifting sentence has its FactBank offsets shifted, as if the file-level text didn't quite match
+        shift = self.rng.choice([-3, -1, 1, 4]) if self.rng.random() < self.drift else 0
+        position = 0
+        for tok_loc, token in enumerate(tokens):
+            start = file_offset + position + (shift if tok_loc > 0 else 0)
+            cur.execute('INSERT INTO offsets VALUES (?, ?, ?, ?, ?, ?)',
+                        (file_name, sent_id, tok_loc, start, start + len(token), "'{}'\n".format(token)))
+            position += len(token) + 1
+
+        if sent_id == 0:
+            return file_offset + position
+
+        for rel_source_id, rel_source_text, _, name in sources:
+            cur.execute('INSERT INTO fb_relSource VALUES (?, ?, ?, ?)',
+                        (file_name, sent_id, "'{}'".format(rel_source_id), "'{}'\n".format(rel_source_text)))
+            if name is not None:
+                cur.execute('INSERT INTO fb_source VALUES (?, ?, ?)', (file_name, sent_id, tokens.index(name)))
+
+        for event_number, event in enumerate(events):
+            eid = "'e{}'".format(event_number + 1)
+            tok_loc = tokens.index(event)
+            text = event if self.rng.random() >= self.missing else event + 'ing'
+            cur.execute('INSERT INTO tokens_tml VALUES (?, ?, ?, ?)', (file_name, sent_id, tok_loc, eid))
+            for rel_source_id, _, _, _ in sources:
+                if self.rng.random() < 0.7:
+                    cur.execute('INSERT INTO fb_factValue VALUES (?, ?, ?, ?, ?, ?)',
+                                (file_name, sent_id, "'{}'".format(rel_source_id), eid, "'{}'".format(text),
+                                 "'{}'\n".format(self.rng.choice(FACT_VALUES))))
+
+        return file_offset + position
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write a synthetic database in FactBank\'s raw schema.')
+    parser.add_argument('--output', default='factbank_data.db')
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--sentences', type=int, default=20, help='sentences per file')
+    parser.add_argument('--depth', type=int, default=2, help='deepest source nesting level')
+    parser.add_argument('--ambiguity', type=float, default=0.3, help='chance a head occurs twice in its sentence')
+    parser.add_argument('--drift', type=float, default=0.1, help='chance a sentence\'s offsets are shifted')
+    parser.add_argument('--missing', type=float, default=0.05, help='chance a target head is absent')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    SyntheticFactBank(args.output, files=args.files, sentences=args.sentences, depth=args.depth,
+                      ambiguity=args.ambiguity, drift=args.drift, missing=args.missing, seed=args.seed).generate()
+    print('Wrote', args.output)